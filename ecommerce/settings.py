@@ -107,6 +107,51 @@ if ENVIRONMENT == 'production' or POSTGRES_LOCALLY == True:
     DATABASES['default'] = dj_database_url.parse(db_url)
 
 
+# Cache
+# Local memory by default; set REDIS_URL to share the cache between workers.
+# 'shared' holds data that must look the same from every worker (serialized
+# carts, resolved JWT users). Without Redis it is a DummyCache, so those reads
+# always go to the database instead of serving another worker's stale copy.
+
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    }
+
+# Serialized carts for get_cart / get_cart_stat, see store/cache.py
+CART_CACHE_ALIAS = os.getenv('CART_CACHE_ALIAS', 'shared')
+CART_CACHE_TIMEOUT = int(os.getenv('CART_CACHE_TIMEOUT', 300))
+
+# Authenticated users resolved from JWTs, see users/authentication.py
+USER_AUTH_CACHE_ALIAS = os.getenv('USER_AUTH_CACHE_ALIAS', 'shared')
+USER_AUTH_CACHE_TIMEOUT = int(os.getenv('USER_AUTH_CACHE_TIMEOUT', 60))
+
+# In-memory bloom filter of blacklisted refresh tokens, see users/blacklist.py
+TOKEN_BLACKLIST_BLOOM_CAPACITY = int(os.getenv('TOKEN_BLACKLIST_BLOOM_CAPACITY', 100000))
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = float(os.getenv('TOKEN_BLACKLIST_BLOOM_ERROR_RATE', 0.001))
+TOKEN_BLACKLIST_REFRESH_INTERVAL = float(os.getenv('TOKEN_BLACKLIST_REFRESH_INTERVAL', 5))
+# Ids can commit out of order; each refresh also re-reads rows blacklisted this many seconds before the last one
+TOKEN_BLACKLIST_REFRESH_MARGIN = float(os.getenv('TOKEN_BLACKLIST_REFRESH_MARGIN', 60))
+TOKEN_BLACKLIST_REBUILD_INTERVAL = float(os.getenv('TOKEN_BLACKLIST_REBUILD_INTERVAL', 3600))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -146,6 +191,17 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Resized copies rendered for uploaded images, see store/images.py
+IMAGE_VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+# Processes rendering images off the request path, 0 renders inline
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
 STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
@@ -173,7 +229,7 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         "rest_framework.permissions.IsAuthenticated"
@@ -215,8 +271,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.CartMergeTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.BlacklistFilterTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -224,6 +280,26 @@ SIMPLE_JWT = {
 }
 
 FLUTTERWAVE_SECRET_KEY = os.getenv('FLUTTERWAVE_SECRET_KEY')
+# "Secret hash" configured for webhooks in the Flutterwave dashboard
+FLUTTERWAVE_WEBHOOK_HASH = os.getenv('FLUTTERWAVE_WEBHOOK_HASH')
+
+# Payment gateway HTTP client, see store/payments.py
+FLUTTERWAVE_BASE_URL = os.getenv('FLUTTERWAVE_BASE_URL', 'https://api.flutterwave.com/v3')
+FLUTTERWAVE_CONNECT_TIMEOUT = float(os.getenv('FLUTTERWAVE_CONNECT_TIMEOUT', 3.05))
+FLUTTERWAVE_READ_TIMEOUT = float(os.getenv('FLUTTERWAVE_READ_TIMEOUT', 15))
+FLUTTERWAVE_POOL_SIZE = int(os.getenv('FLUTTERWAVE_POOL_SIZE', 10))
+FLUTTERWAVE_VERIFY_RETRIES = int(os.getenv('FLUTTERWAVE_VERIFY_RETRIES', 3))
+
+# How long initiate_payment replays the response stored for an Idempotency-Key
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Price histogram edges for the products facets endpoint, see store/facets.py
+PRODUCT_PRICE_BUCKETS = [10, 25, 50, 100, 250, 500]
+FACETS_CACHE_ALIAS = os.getenv('FACETS_CACHE_ALIAS', 'shared')
+FACETS_CACHE_TIMEOUT = int(os.getenv('FACETS_CACHE_TIMEOUT', 600))
+
+# How long checkout holds stock for an unpaid transaction
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
 
 REACT_BASE_URL = os.getenv("REACT_BASE_URL", "http:/localhost:5173")
 
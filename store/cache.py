@@ -0,0 +1,90 @@
+"""
+Read cache for serialized carts.
+
+get_cart and get_cart_stat store their response data under the user id (for
+logged-in users) or the cart_code (for guests). Every write to a cart must call
+invalidate_cart() so the next read rebuilds it. The backend is whichever cache
+CART_CACHE_ALIAS points at, the 'shared' alias by default: Redis when REDIS_URL
+is set, otherwise a DummyCache. A per-process local memory cache would keep
+serving a cart to one worker after another worker changed it, so without a
+shared backend the cart is simply read from the database every time.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+HITS_KEY = 'cart:stats:hits'
+MISSES_KEY = 'cart:stats:misses'
+VARIANTS = ('full', 'stat')
+
+
+def _cache():
+    return caches[settings.CART_CACHE_ALIAS]
+
+
+def _keys(user_id=None, cart_code=None):
+    keys = []
+    for variant in VARIANTS:
+        if user_id:
+            keys.append(f'cart:user:{user_id}:{variant}')
+        if cart_code:
+            keys.append(f'cart:code:{cart_code}:{variant}')
+    return keys
+
+
+def _request_key(request, variant):
+    if request.user.is_authenticated:
+        return f'cart:user:{request.user.id}:{variant}'
+    cart_code = request.query_params.get('cart_code')
+    if cart_code:
+        return f'cart:code:{cart_code}:{variant}'
+    return None
+
+
+def _count(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cached_cart(request, variant):
+    """Return the cached serialized cart for this request, or None."""
+    key = _request_key(request, variant)
+    if key is None:
+        return None
+
+    data = _cache().get(key)
+    _count(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_cached_cart(request, variant, data):
+    key = _request_key(request, variant)
+    if key is not None:
+        _cache().set(key, data, settings.CART_CACHE_TIMEOUT)
+
+
+def invalidate(user_id=None, cart_code=None):
+    """Drop the cached variants for a user and/or cart_code once the current transaction commits."""
+    keys = _keys(user_id, cart_code)
+    if keys:
+        transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def invalidate_cart(cart):
+    invalidate(cart.user_id, cart.cart_code)
+
+
+def cache_stats():
+    cache = _cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def reset_cache_stats():
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
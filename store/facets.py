@@ -0,0 +1,98 @@
+"""
+Filter sidebar facets: product counts per category and a price histogram.
+
+Both come from one grouped query over (category, price bucket); category
+counts are the bucket counts summed per category. Bucket edges are
+PRODUCT_PRICE_BUCKETS. Results are cached for FACETS_CACHE_TIMEOUT seconds
+under a version number that every product write bumps (see store/signals.py),
+so an edit is visible on the next request instead of after the timeout. The
+version has to be seen by every process, web workers and management commands
+alike, so FACETS_CACHE_ALIAS defaults to the 'shared' alias: Redis when
+REDIS_URL is set, otherwise no caching at all.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, Count, DecimalField, IntegerField, Max, Min, Value, When
+
+VERSION_KEY = 'facets:version'
+
+
+def _cache():
+    return caches[settings.FACETS_CACHE_ALIAS]
+
+
+def bump_version():
+    _cache().set(VERSION_KEY, time.time_ns(), None)
+
+
+def _cache_key(category, q):
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        bump_version()
+        version = _cache().get(VERSION_KEY)
+    params = hashlib.md5(f'{category or ""}\0{q or ""}'.encode()).hexdigest()
+    return f'facets:{version}:{params}'
+
+
+def _bucket(edges):
+    # Bucket i holds prices in [edges[i - 1], edges[i]); the last one is open ended
+    return Case(
+        *[When(price__lt=edge, then=Value(i)) for i, edge in enumerate(edges)],
+        default=Value(len(edges)),
+        output_field=IntegerField(),
+    )
+
+
+def _format_price(value):
+    # Rendered like ProductSerializer's price field
+    return None if value is None else f'{value:.2f}'
+
+
+def compute_facets(products, category=None):
+    """
+    Facets of the `products` queryset. Category counts cover every category
+    so the sidebar can offer the others; the price figures only cover
+    `category` when one is selected.
+    """
+    edges = settings.PRODUCT_PRICE_BUCKETS
+    price = DecimalField(max_digits=10, decimal_places=2)
+    rows = (
+        products.order_by()
+        .annotate(bucket=_bucket(edges))
+        .values('category', 'bucket')
+        .annotate(count=Count('id'), min_price=Min('price', output_field=price), max_price=Max('price', output_field=price))
+    )
+
+    categories = {}
+    buckets = [0] * (len(edges) + 1)
+    low = high = None
+    for row in rows:
+        if row['category']:
+            categories[row['category']] = categories.get(row['category'], 0) + row['count']
+        if category and row['category'] != category:
+            continue
+        buckets[row['bucket']] += row['count']
+        low = row['min_price'] if low is None else min(low, row['min_price'])
+        high = row['max_price'] if high is None else max(high, row['max_price'])
+
+    bounds = [None, *edges, None]
+    return {
+        'categories': [{'category': name, 'count': count} for name, count in sorted(categories.items())],
+        'price': {'min': _format_price(low), 'max': _format_price(high)},
+        'price_buckets': [
+            {'min': bounds[i], 'max': bounds[i + 1], 'count': count}
+            for i, count in enumerate(buckets)
+        ],
+    }
+
+
+def get_facets(products, category=None, q=None):
+    key = _cache_key(category, q)
+    data = _cache().get(key)
+    if data is None:
+        data = compute_facets(products, category)
+        _cache().set(key, data, settings.FACETS_CACHE_TIMEOUT)
+    return data
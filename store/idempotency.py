@@ -0,0 +1,54 @@
+"""
+Idempotency-Key support for non idempotent endpoints (initiate_payment).
+
+The first request with a key claims it by inserting a row; the unique
+(user, endpoint, key) constraint makes concurrent duplicates lose that race
+instead of repeating the work. Once the response is known it is stored on the
+row and replayed to every retry within IDEMPOTENCY_KEY_TTL.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IN_PROGRESS = (409, {'error': 'A request with this Idempotency-Key is still being processed.'})
+
+
+def begin(user, endpoint, key):
+    """
+    Claim `key` for a request. Returns (record, None) when the caller should
+    handle the request, or (None, (status, body)) with the response to send back.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, endpoint=endpoint, key=key), None
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(user=user, endpoint=endpoint, key=key)
+
+    if record.created_at < now - settings.IDEMPOTENCY_KEY_TTL:
+        # Expired: reuse the key, unless another request took it over first
+        taken_over = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            created_at=now, response_status=None, response_body=None
+        )
+        if taken_over:
+            record.created_at, record.response_status, record.response_body = now, None, None
+            return record, None
+        return None, IN_PROGRESS
+
+    if record.response_status is None:
+        return None, IN_PROGRESS
+    return None, (record.response_status, record.response_body)
+
+
+def complete(record, status_code, body):
+    """Store the response so retries with the same key replay it."""
+    record.response_status = status_code
+    record.response_body = body
+    record.save(update_fields=['response_status', 'response_body'])
+
+
+def release(record):
+    """Forget the key after a failure that is worth retrying."""
+    record.delete()
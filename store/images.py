@@ -0,0 +1,178 @@
+"""
+Resized image variants for uploaded media.
+
+When a product image is uploaded, every size in IMAGE_VARIANTS is rendered in
+every format in IMAGE_VARIANT_FORMATS (e.g. products/images/variants/shoe.jpg/card.webp,
+keyed on the whole file name so shoe.jpg and shoe.png never share files), and
+the stored names are recorded on Product.image_variants for the serializers.
+Replacing an image deletes the old variant files.
+Profile images are thumbnailed in place. Pillow runs in a process pool
+(IMAGE_WORKERS processes) after the saving transaction commits, so requests
+never wait on it. IMAGE_WORKERS = 0 renders inline instead.
+
+The workers read and write files by path, so this expects the filesystem
+storage configured in settings.STORAGES.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+
+
+def variant_names(name):
+    """Storage names of every variant of the image stored as `name`."""
+    directory, filename = os.path.split(name)
+    return {
+        variant: {
+            fmt: os.path.join(directory, 'variants', filename, f'{variant}.{"jpg" if fmt == "jpeg" else fmt}')
+            for fmt in settings.IMAGE_VARIANT_FORMATS
+        }
+        for variant in settings.IMAGE_VARIANTS
+    }
+
+
+def render_variants(source, targets, quality):
+    """
+    Write resized copies of the image at path `source`. `targets` is a list of
+    (path, (max_width, max_height), fmt). Runs in the worker processes.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        for path, size, fmt in targets:
+            copy = image.copy()
+            copy.thumbnail(size, Image.LANCZOS)
+            if fmt == 'jpeg' and copy.mode not in ('RGB', 'L'):
+                copy = copy.convert('RGB')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            copy.save(path, quality=quality, **SAVE_OPTIONS[fmt])
+
+
+def render_thumbnail(path, size):
+    """Shrink the image at `path` in place to fit `size`. Runs in the worker processes."""
+    with Image.open(path) as image:
+        if image.width <= size[0] and image.height <= size[1]:
+            return
+        image.thumbnail(size)
+        image.save(path)
+
+
+_pool = None
+_recorder = None
+_pool_lock = threading.Lock()
+
+
+def _executors():
+    global _pool, _recorder
+    with _pool_lock:
+        if _pool is None:
+            # Fresh interpreters rather than forks of a threaded web worker
+            _pool = ProcessPoolExecutor(settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            # Results are written back from a thread of our own, not the pool's bookkeeping thread
+            _recorder = ThreadPoolExecutor(1, thread_name_prefix='image-variants')
+        return _pool, _recorder
+
+
+def _discard(pool):
+    # A worker died (e.g. killed for memory); the next task starts a new pool
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _run(task, *args, on_done=None):
+    if settings.IMAGE_WORKERS <= 0:
+        task(*args)
+        if on_done:
+            on_done()
+        return
+
+    pool, recorder = _executors()
+    try:
+        future = pool.submit(task, *args)
+    except BrokenProcessPool:
+        _discard(pool)
+        pool, recorder = _executors()
+        future = pool.submit(task, *args)
+
+    def finished(future):
+        error = future.exception()
+        if error:
+            logger.error("image task %s%r failed", task.__name__, args, exc_info=error)
+            if isinstance(error, BrokenProcessPool):
+                _discard(pool)
+        elif on_done:
+            recorder.submit(on_done)
+
+    future.add_done_callback(finished)
+
+
+def variant_targets(name):
+    names = variant_names(name)
+    targets = [
+        (default_storage.path(names[variant][fmt]), size, fmt)
+        for variant, size in settings.IMAGE_VARIANTS.items()
+        for fmt in settings.IMAGE_VARIANT_FORMATS
+    ]
+    return names, targets
+
+
+def record_variants(product_id, name, variants):
+    from .models import Product
+    # Skip if the image was replaced while the variants were rendered
+    Product.objects.filter(pk=product_id, image=name).update(image_variants=variants)
+
+
+def _record_in_background(product_id, name, variants):
+    try:
+        record_variants(product_id, name, variants)
+    finally:
+        close_old_connections()
+
+
+def generate_product_variants(product):
+    """Render the variants of product.image once the current transaction commits."""
+    name = product.image.name
+    names, targets = variant_targets(name)
+    source = default_storage.path(name)
+    transaction.on_commit(lambda: _run(
+        render_variants, source, targets, settings.IMAGE_VARIANT_QUALITY,
+        on_done=lambda: _record_in_background(product.pk, name, names),
+    ))
+
+
+def generate_profile_thumbnail(profile, size=(300, 300)):
+    path = default_storage.path(profile.image.name)
+    transaction.on_commit(lambda: _run(render_thumbnail, path, size))
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+    for directory in {os.path.dirname(default_storage.path(name)) for name in names}:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # Not empty or already gone
+
+
+def delete_variants(variants):
+    """Delete the files of a Product.image_variants mapping once the current transaction commits."""
+    names = [name for formats in (variants or {}).values() for name in formats.values()]
+    if names:
+        transaction.on_commit(lambda: _delete_files(names))
@@ -0,0 +1,114 @@
+"""
+Stock reservations.
+
+Checkout holds the units of every stock tracked product in the cart for
+STOCK_RESERVATION_TTL. Units are taken with a conditional
+UPDATE ... SET stock = stock - n WHERE stock >= n, so a hot product only ever
+sees short single row updates and never oversells. Product rows are always
+updated in product id order, so two checkouts sharing products cannot
+deadlock. A completed payment consumes its holds; a failed one, an expired one
+(release_expired_reservations) or one superseded by a newer checkout gives the
+units back and is closed, so it can no longer complete with units it does not
+hold. A charge that still arrives for a closed transaction has to take its
+units from stock again, see retake().
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product, StockReservation, Transaction
+
+
+class OutOfStock(ValueError):
+    pass
+
+
+def reserve(payment, lines):
+    """
+    Hold stock for `lines`, an iterable of (product_id, name, quantity, stock)
+    where stock is None for products whose stock is not tracked.
+    Must run inside the transaction that creates `payment`.
+    Raises OutOfStock, which rolls the whole checkout back.
+    """
+    expires_at = timezone.now() + settings.STOCK_RESERVATION_TTL
+    reservations = []
+    for product_id, name, quantity, stock in sorted(lines):
+        if stock is None:
+            continue
+        _take(product_id, name, quantity)
+        reservations.append(StockReservation(product_id=product_id, transaction=payment, quantity=quantity, expires_at=expires_at))
+    StockReservation.objects.bulk_create(reservations)
+
+
+def _take(product_id, name, quantity):
+    taken = Product.objects.filter(id=product_id, stock__gte=quantity).update(stock=F('stock') - quantity)
+    if not taken:
+        raise OutOfStock(f'Not enough stock for {name}.')
+
+
+def release(reservations):
+    """
+    Give the units held by the `reservations` queryset back to stock and delete
+    them. Rows locked by a concurrent release are skipped, so units are never
+    returned twice. Returns the number of reservations released.
+    """
+    with transaction.atomic():
+        claimed = list(
+            reservations.select_for_update(skip_locked=True).values_list('id', 'product_id', 'quantity')
+        )
+        if not claimed:
+            return 0
+
+        units = defaultdict(int)
+        for _, product_id, quantity in claimed:
+            units[product_id] += quantity
+        for product_id, quantity in sorted(units.items()):
+            Product.objects.filter(id=product_id).update(stock=F('stock') + quantity)
+
+        StockReservation.objects.filter(id__in=[row[0] for row in claimed]).delete()
+    return len(claimed)
+
+
+def consume(reservations):
+    """The payment went through: the held units are sold, just drop the holds."""
+    return reservations.delete()[0]
+
+
+def close(payments, status):
+    """
+    Close the pending transactions in the `payments` queryset with `status`
+    ('expired' or 'abandoned') and give their held units back. Transactions
+    locked by a concurrent settlement are skipped; that settlement decides
+    them. Returns the ids of the closed transactions.
+    """
+    with transaction.atomic():
+        ids = list(
+            payments.filter(status='pending').select_for_update(skip_locked=True).values_list('id', flat=True)
+        )
+        if ids:
+            release(StockReservation.objects.filter(transaction_id__in=ids))
+            Transaction.objects.filter(id__in=ids).update(status=status, modified_at=timezone.now())
+    return ids
+
+
+def retake(payment):
+    """
+    Take the units of `payment`'s lines from stock again, for a charge that
+    completed after its holds were returned. Takes all of them or, returning
+    False, none.
+    """
+    lines = (
+        payment.items.filter(product__stock__isnull=False)
+        .order_by('product_id')
+        .values_list('product_id', 'product_name', 'quantity')
+    )
+    try:
+        with transaction.atomic():
+            for product_id, name, quantity in lines:
+                _take(product_id, name, quantity)
+    except OutOfStock:
+        return False
+    return True
@@ -0,0 +1,78 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+
+from store.inventory import OutOfStock
+from store.models import Cart, CartItem, Product, StockReservation, Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Run many concurrent checkouts of one hot product and report throughput, "
+        "latency and whether stock was oversold. Creates its own product and guest "
+        "carts and deletes them afterwards; point it at a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=2000, help="Checkouts to attempt (default 2000).")
+        parser.add_argument('--stock', type=int, default=500, help="Units of the hot product (default 500).")
+        parser.add_argument('--threads', type=int, default=32, help="Concurrent checkouts (default 32).")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark product, carts and transactions.")
+
+    def handle(self, *args, **options):
+        product = Product.objects.create(
+            name=f'Checkout benchmark {uuid4().hex[:8]}', price=Decimal('10.00'), image='', stock=options['stock'],
+        )
+        carts = Cart.objects.bulk_create([Cart(cart_code=str(uuid4())) for _ in range(options['checkouts'])])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            results = list(pool.map(self.checkout, carts))
+        elapsed = time.monotonic() - started
+
+        outcomes = [outcome for outcome, _ in results]
+        timings = sorted(ms for _, ms in results)
+        product.refresh_from_db()
+        held = StockReservation.objects.filter(product=product).aggregate(units=Sum('quantity'))['units'] or 0
+
+        self.stdout.write(
+            f"{len(carts)} checkouts with {options['threads']} threads in {elapsed:.2f}s "
+            f"({len(carts) / elapsed:.0f}/s): {outcomes.count('reserved')} reserved, "
+            f"{outcomes.count('out_of_stock')} out of stock, {outcomes.count('error')} errors"
+        )
+        self.stdout.write(
+            f"latency p50 {statistics.median(timings):.1f}ms  "
+            f"p95 {timings[min(len(timings) - 1, int(len(timings) * 0.95))]:.1f}ms  max {timings[-1]:.1f}ms"
+        )
+        consistent = product.stock + held == options['stock'] and held == outcomes.count('reserved')
+        message = f"stock left {product.stock}, units held {held}"
+        if consistent:
+            self.stdout.write(self.style.SUCCESS(f"No oversell: {message}."))
+        else:
+            self.stdout.write(self.style.ERROR(f"Stock does not add up: {message}."))
+
+        if not options['keep']:
+            Transaction.objects.filter(cart__in=carts).delete()
+            Cart.objects.filter(id__in=[cart.id for cart in carts]).delete()
+            product.delete()
+
+    def checkout(self, cart):
+        started = time.perf_counter()
+        try:
+            Transaction.objects.create_for_cart(cart, None, tax=Decimal('0.00'), currency='USD')
+            outcome = 'reserved'
+        except OutOfStock:
+            outcome = 'out_of_stock'
+        except DatabaseError:
+            # e.g. SQLite's "database is locked" under concurrent writers
+            outcome = 'error'
+        finally:
+            connection.close()
+        return outcome, (time.perf_counter() - started) * 1000
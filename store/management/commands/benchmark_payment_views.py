@@ -0,0 +1,136 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+import httpx
+from django.contrib.auth.hashers import make_password
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store.models import Cart, CartItem, Product, Transaction
+from users.models import User
+
+
+class SlowGateway(BaseHTTPRequestHandler):
+    """Answers POST /payments like Flutterwave, after `delay` seconds."""
+    protocol_version = 'HTTP/1.1'
+    delay = 0.2
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.delay)
+        data = json.dumps({'status': 'success', 'data': {'link': f"https://checkout.test/{body.get('tx_ref')}"}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test initiate_payment through the WSGI handler (a fixed number of "
+        "sync workers) and its async variant through the ASGI handler (one event "
+        "loop), against a local gateway stub that answers after --gateway-delay "
+        "seconds. Creates its own users, carts and product and deletes them "
+        "afterwards; point it at a scratch database. On SQLite, concurrent "
+        "checkouts fail with \"database is locked\" unless DB_URL sets "
+        "?transaction_mode=IMMEDIATE&timeout=30."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Payments to start per stack (default 200).")
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent WSGI workers (default 4).")
+        parser.add_argument('--concurrency', type=int, default=100, help="Requests in flight on the ASGI loop (default 100).")
+        parser.add_argument('--gateway-delay', type=float, default=0.2, help="Seconds the stub takes per call (default 0.2).")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark users, carts and transactions.")
+
+    def handle(self, *args, **options):
+        SlowGateway.delay = options['gateway_delay']
+        gateway = ThreadingHTTPServer(('127.0.0.1', 0), SlowGateway)
+        threading.Thread(target=gateway.serve_forever, daemon=True).start()
+
+        product = Product.objects.create(name=f'Payment benchmark {uuid4().hex[:8]}', price=Decimal('10.00'), image='')
+        users = self.create_users(product, options['requests'] * 2)
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+
+        try:
+            with override_settings(
+                FLUTTERWAVE_BASE_URL=f'http://127.0.0.1:{gateway.server_port}', FLUTTERWAVE_SECRET_KEY='benchmark',
+            ):
+                wsgi = self.run_wsgi(tokens[:options['requests']], options['workers'])
+                self.report(f"WSGI, {options['workers']} workers", *wsgi)
+                asgi = asyncio.run(self.run_asgi(tokens[options['requests']:], options['concurrency']))
+                self.report(f"ASGI, {options['concurrency']} in flight", *asgi)
+        finally:
+            gateway.shutdown()
+            if not options['keep']:
+                Transaction.objects.filter(user__in=users).delete()
+                Cart.objects.filter(user__in=users).delete()
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+                product.delete()
+
+    def create_users(self, product, count):
+        run = uuid4().hex[:8]
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(email=f'payment-benchmark-{run}-{i}@example.com', password=password) for i in range(count)
+        ])
+        carts = Cart.objects.bulk_create([Cart(cart_code=str(uuid4()), user=user) for user in users])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+        return users
+
+    def run_wsgi(self, tokens, workers):
+        def call(token):
+            started = time.perf_counter()
+            try:
+                response = Client(raise_request_exception=False).post(
+                    '/api/initiate_payment/', HTTP_AUTHORIZATION=f'Bearer {token}',
+                )
+                return response.status_code, (time.perf_counter() - started) * 1000
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(call, tokens))
+        return results, time.monotonic() - started
+
+    async def run_asgi(self, tokens, concurrency):
+        app = get_asgi_application()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def call(client, token):
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post(
+                    '/api/async/initiate_payment/', headers={'Authorization': f'Bearer {token}'},
+                )
+                return response.status_code, (time.perf_counter() - started) * 1000
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver', timeout=None) as client:
+            started = time.monotonic()
+            results = await asyncio.gather(*(call(client, token) for token in tokens))
+            return results, time.monotonic() - started
+
+    def report(self, label, results, elapsed):
+        timings = sorted(ms for _, ms in results)
+        failed = sum(1 for code, _ in results if code >= 300)
+        self.stdout.write(
+            f"{label}: {len(results)} payments in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s), "
+            f"{failed} failed, latency p50 {statistics.median(timings):.0f}ms  "
+            f"p95 {timings[min(len(timings) - 1, int(len(timings) * 0.95))]:.0f}ms"
+        )
@@ -0,0 +1,51 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import Product
+from store.pagination import SearchCursorPagination
+from store.search import search_products, search_terms
+
+
+class Command(BaseCommand):
+    help = (
+        "Time product search against the current catalog (load one with import_products) "
+        "and print latency percentiles for the first page of results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500, help="Searches to run (default 500).")
+        parser.add_argument('--prefix', type=int, default=3, help="Characters of each word to search for, 0 for whole words (default 3).")
+        parser.add_argument('--page-size', type=int, default=SearchCursorPagination.page_size)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        count = Product.objects.count()
+        if not count:
+            raise CommandError("There are no products to search.")
+
+        rng = random.Random(options['seed'])
+        # Search text taken from random product names, so most queries have hits
+        names = list(Product.objects.order_by('?').values_list('name', flat=True)[:options['queries']])
+        queries = []
+        for _ in range(options['queries']):
+            words = search_terms(rng.choice(names)) or ['a']
+            word = rng.choice(words)
+            queries.append(word[:options['prefix']] if options['prefix'] else word)
+
+        ordering = SearchCursorPagination.ordering
+        timings, hits = [], 0
+        for q in queries:
+            started = time.perf_counter()
+            page = list(search_products(Product.objects.all(), q).order_by(*ordering)[:options['page_size']])
+            timings.append((time.perf_counter() - started) * 1000)
+            hits += bool(page)
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{len(queries)} searches over {count} products, {hits} with results: "
+            f"p50 {statistics.median(timings):.1f}ms  p95 {p95:.1f}ms  max {timings[-1]:.1f}ms"
+        )
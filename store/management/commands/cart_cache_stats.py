@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show the cart read cache hit/miss counters (shared across workers only with the Redis backend)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them.")
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        lookups = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / lookups if lookups else 0
+        self.stdout.write(f"hits: {stats['hits']}  misses: {stats['misses']}  hit ratio: {ratio:.1%}")
+
+        if options['reset']:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
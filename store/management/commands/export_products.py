@@ -0,0 +1,44 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from store.models import Product
+
+FIELDS = ['id', 'name', 'slug', 'description', 'price', 'category', 'stock', 'image']
+
+
+class Command(BaseCommand):
+    help = "Stream every product to a CSV or JSON lines file (or stdout), in the format import_products reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, '-' for stdout (default).")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension, csv for stdout.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched from the database at a time (default 2000).")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith('.jsonl') else 'csv')
+        rows = Product.objects.order_by('id').values_list(*FIELDS).iterator(chunk_size=options['chunk_size'])
+
+        out = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        count = 0
+        try:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(FIELDS)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    out.write(json.dumps(dict(zip(FIELDS, row)), cls=DjangoJSONEncoder) + '\n')
+                    count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        if out is not sys.stdout:
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} product(s) to {path}."))
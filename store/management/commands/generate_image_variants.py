@@ -0,0 +1,51 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from store.images import record_variants, render_variants, variant_targets
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = "Render the resized image variants of products that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-render every product, not only those without variants.")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default IMAGE_WORKERS, at least 1).")
+        parser.add_argument('--batch-size', type=int, default=200, help="Products submitted to the pool at a time (default 200).")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            products = products.filter(image_variants={})
+
+        workers = max(options['workers'] or settings.IMAGE_WORKERS, 1)
+        done = failed = last_id = 0
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                batch = list(products.filter(id__gt=last_id).values_list('id', 'image')[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                jobs = []
+                for product_id, name in batch:
+                    names, targets = variant_targets(name)
+                    future = pool.submit(render_variants, default_storage.path(name), targets, settings.IMAGE_VARIANT_QUALITY)
+                    jobs.append((product_id, name, names, future))
+
+                for product_id, name, names, future in jobs:
+                    try:
+                        future.result()
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"Product {product_id} ({name}): {exc}")
+                        continue
+                    record_variants(product_id, name, names)
+                    done += 1
+                self.stdout.write(f"Rendered {done} product(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {done} product(s), {failed} failed."))
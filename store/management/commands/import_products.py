@@ -0,0 +1,166 @@
+import csv
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store import facets, images
+from store.models import Product
+from store.similarity import rebuild_all
+from store.slugs import SlugAllocator
+
+FIELDS = ('name', 'slug', 'description', 'price', 'category', 'stock', 'image')
+CATEGORIES = {value for value, _ in Product.CATEGORY}
+
+
+def read_rows(path, fmt):
+    """Yield (line number, row) from a CSV or JSON lines file, one row at a time."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(f, start=1):
+                if line.strip():
+                    # Decoded by clean_row, so a bad line is skipped like any other invalid row
+                    yield line_num, line
+
+
+def clean_row(row):
+    if isinstance(row, str):
+        row = json.loads(row)
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    data = {
+        'name': name[:100],
+        'slug': (row.get('slug') or '').strip() or None,
+        'price': price,
+    }
+    # Optional columns missing from the file are left alone on existing products
+    if 'description' in row:
+        data['description'] = row['description'] or None
+    if 'category' in row:
+        category = row['category'] or None
+        if category is not None and category not in CATEGORIES:
+            raise ValueError(f"unknown category {category!r}")
+        data['category'] = category
+    if 'stock' in row:
+        stock = row['stock']
+        stock = int(stock) if stock not in (None, '') else None
+        if stock is not None and stock < 0:
+            raise ValueError("stock cannot be negative")
+        data['stock'] = stock
+    if 'image' in row:
+        data['image'] = row['image'] or ''
+    return data
+
+
+def update_products(changed, batch_size):
+    """
+    bulk_update `changed`, {product id: field values}, writing only the fields
+    each row supplied. A new image drops the variants rendered for the old one
+    and deletes their files.
+    """
+    with_image = [product_id for product_id, data in changed.items() if 'image' in data]
+    current = Product.objects.filter(id__in=with_image).values_list('id', 'image', 'image_variants')
+    for product_id, image, variants in current:
+        if changed[product_id]['image'] != image:
+            changed[product_id]['image_variants'] = {}
+            images.delete_variants(variants)
+
+    groups = defaultdict(list)
+    for product_id, data in changed.items():
+        groups[tuple(sorted(data))].append(Product(id=product_id, **data))
+    for fields, products in groups.items():
+        Product.objects.bulk_update(products, fields, batch_size=batch_size)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from a CSV or JSON lines file. Rows whose slug matches an "
+        "existing product update the columns present in the file, all others are "
+        "created with a unique slug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, with the columns/keys " + ", ".join(FIELDS) + ".")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per transaction and bulk statement (default 2000).")
+        parser.add_argument('--no-update', action='store_true', help="Skip rows whose slug already exists instead of updating them.")
+        parser.add_argument('--skip-similar', action='store_true', help="Do not rebuild the similar products index afterwards.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        # One query for every existing slug; new slugs are resolved in memory from here on
+        existing = dict(Product.objects.exclude(slug__isnull=True).values_list('slug', 'id'))
+        slugs = SlugAllocator(existing)
+
+        created = updated = skipped = 0
+        rows = read_rows(path, fmt)
+        chunk_number = 0
+        while True:
+            try:
+                chunk = list(islice(rows, batch_size))
+            except csv.Error as exc:
+                raise CommandError(f"Could not parse {path}: {exc}")
+            if not chunk:
+                break
+            chunk_number += 1
+
+            new, changed = [], {}
+            for line_num, row in chunk:
+                try:
+                    data = clean_row(row)
+                except (ValueError, AttributeError) as exc:
+                    skipped += 1
+                    self.stderr.write(f"Skipped line {line_num}: {exc}")
+                    continue
+
+                product_id = existing.get(data['slug'])
+                if product_id is not None:
+                    if options['no_update']:
+                        skipped += 1
+                        continue
+                    data.pop('slug')
+                    changed[product_id] = data
+                else:
+                    data['slug'] = slugs.allocate(data.pop('slug') or data['name'])
+                    new.append(Product(**data))
+
+            with transaction.atomic():
+                for product in Product.objects.bulk_create(new, batch_size=batch_size):
+                    existing[product.slug] = product.id
+                update_products(changed, batch_size)
+            created += len(new)
+            updated += len(changed)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"Chunk {chunk_number}: {created} created, {updated} updated ({(created + updated) / elapsed:.0f} rows/s)")
+
+        if created or updated:
+            # bulk_create/bulk_update send no signals
+            facets.bump_version()
+
+        if not options['skip_similar'] and (created or updated):
+            self.stdout.write("Rebuilding similar products...")
+            rebuild_all()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} new and {updated} updated product(s), skipped {skipped}, in {elapsed:.2f}s. "
+            "Run generate_image_variants to render their images."
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Merge users' duplicate open carts into their most recently modified one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be merged.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        users = (
+            Cart.objects.filter(paid=False, user__isnull=False)
+            .values('user_id')
+            .annotate(open_carts=Count('id'))
+            .filter(open_carts__gt=1)
+        )
+
+        merged = skipped = 0
+        for row in users.iterator():
+            with transaction.atomic():
+                carts = Cart.objects.select_for_update().filter(user_id=row['user_id'], paid=False).order_by(
+                    F('modified_at').desc(nulls_last=True), '-id'
+                )
+                keep, *duplicates = carts
+                # A cart being paid for must keep the contents that were charged
+                if any(cart.checkout_in_progress() for cart in [keep, *duplicates]):
+                    skipped += 1
+                    self.stdout.write(f"User {row['user_id']}: skipped, a cart has a payment in progress")
+                    continue
+                for other in duplicates:
+                    if not dry_run:
+                        keep.merge_from(other)
+                    merged += 1
+            self.stdout.write(f"User {row['user_id']}: {len(duplicates)} duplicate cart(s) into {keep.cart_code}")
+
+        verb = "Would merge" if dry_run else "Merged"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {merged} duplicate open cart(s); skipped {skipped} user(s) with a payment in progress."
+        ))
@@ -0,0 +1,92 @@
+import time
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from store import payments
+from store.models import PaymentEvent, Transaction
+
+RETRY_DELAY = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain stored Flutterwave webhook events: re-verify each charge with the "
+        "gateway and settle the matching Transaction and Cart. Several workers "
+        "can run side by side: each leases its batch in a short transaction and "
+        "calls the gateway with no database transaction open."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Events claimed per batch (default 50).")
+        parser.add_argument('--max-attempts', type=int, default=5, help="Give up on an event after this many failures.")
+        parser.add_argument('--lease', type=float, default=300, help="Seconds a claimed batch stays reserved for this worker (default 300).")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new events instead of exiting when the queue is empty.")
+        parser.add_argument('--sleep', type=float, default=5, help="Seconds to wait between polls with --loop (default 5).")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = self.process_batch(options['batch_size'], options['max_attempts'], options['lease'])
+            total += processed
+            if processed:
+                self.stdout.write(f"Processed {processed} event(s), {total} in total")
+            elif options['loop']:
+                time.sleep(options['sleep'])
+            else:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Done, processed {total} event(s)."))
+
+    def claim_batch(self, batch_size, max_attempts, lease):
+        """Lease up to `batch_size` due events to this worker. Only the claim runs under row locks."""
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                PaymentEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True, attempts__lt=max_attempts)
+                .filter(Q(leased_until__isnull=True) | Q(leased_until__lt=now))
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            PaymentEvent.objects.filter(id__in=ids).update(leased_until=now + timedelta(seconds=lease))
+        return list(PaymentEvent.objects.filter(id__in=ids).order_by('id'))
+
+    def process_batch(self, batch_size, max_attempts, lease):
+        events = self.claim_batch(batch_size, max_attempts, lease)
+        for event in events:
+            # Gateway call outside any transaction; apply_verification settles in its own
+            try:
+                self.process_event(event)
+            except (requests.exceptions.RequestException, ValueError, Transaction.DoesNotExist) as e:
+                # Back off before the next attempt: 10s, 20s, 40s, ...
+                retry_at = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** event.attempts)
+                PaymentEvent.objects.filter(pk=event.pk).update(
+                    attempts=F('attempts') + 1, last_error=str(e), leased_until=retry_at,
+                )
+            else:
+                PaymentEvent.objects.filter(pk=event.pk).update(
+                    processed_at=timezone.now(), last_error='', leased_until=None,
+                )
+        return len(events)
+
+    def process_event(self, event):
+        if event.event_type != 'charge.completed':
+            return
+
+        data = event.payload.get('data') or {}
+        payment = Transaction.objects.select_related('cart').get(ref=data.get('tx_ref'))
+        if payment.status in ('completed', 'refund_required'):
+            return
+
+        # Never trust the webhook body alone, confirm the charge with the gateway
+        response = payments.get_client().verify_transaction(data.get('id'))
+        response_data = response.json()
+        if response_data.get('status') != 'success':
+            raise ValueError(f"Verification failed: {response_data.get('message', response.status_code)}")
+
+        payment.apply_verification(response_data.get('data') or {})
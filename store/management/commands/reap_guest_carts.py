@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete unpaid guest carts that have been idle for longer than --days. "
+        "Works through the table in small primary key ordered batches so no "
+        "statement holds locks for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Idle age, based on Cart.modified_at (default 30).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Carts deleted per statement (default 1000).")
+        parser.add_argument('--sleep', type=float, default=0, help="Seconds to pause between batches.")
+        parser.add_argument('--dry-run', action='store_true', help="Count the stale carts without deleting them.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        stale = Cart.objects.filter(
+            user__isnull=True,
+            paid=False,
+            modified_at__lt=cutoff,
+            transactions__isnull=True,
+        )
+
+        started = time.monotonic()
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(stale.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            if dry_run:
+                total += len(ids)
+            else:
+                # Re-apply the stale filter so carts touched since the scan survive
+                deleted, per_model = stale.filter(id__in=ids).delete()
+                total += per_model.get('store.Cart', 0)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{total} carts {'found' if dry_run else 'deleted'} ({total / elapsed:.0f} rows/s), up to id {last_id}")
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        verb = "Would delete" if dry_run else "Deleted"
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {total} guest carts idle since before {cutoff:%Y-%m-%d %H:%M} in {elapsed:.2f}s ({rate:.0f} rows/s)."
+        ))
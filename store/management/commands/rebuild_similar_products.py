@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.similarity import rebuild_all, SIMILAR_PRODUCTS_LIMIT
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed similar products index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = rebuild_all(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} similar product links (top {SIMILAR_PRODUCTS_LIMIT} per product) in {elapsed:.2f}s."
+        ))
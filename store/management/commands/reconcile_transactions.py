@@ -0,0 +1,114 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store import inventory, payments
+from store.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Resolve transactions stuck in 'pending' (e.g. the user closed the tab "
+        "before payment_callback) by verifying them with Flutterwave. Scans in "
+        "primary key ordered batches and verifies each batch concurrently. Each "
+        "result is settled on its own with Transaction.apply_verification, the "
+        "same path as the payment callback and webhook, so a transaction that was "
+        "settled or closed meanwhile is never overwritten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, help="Only pending transactions older than this many minutes (default 30).")
+        parser.add_argument('--abandon-after', type=int, default=1440, help="Mark transactions the gateway has no charge for as abandoned after this many minutes (default 1440).")
+        parser.add_argument('--batch-size', type=int, default=200, help="Transactions per batch (default 200).")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent gateway requests (default 8).")
+        parser.add_argument('--base-url', help="Gateway base URL, e.g. a local fake gateway. Defaults to FLUTTERWAVE_BASE_URL.")
+        parser.add_argument('--dry-run', action='store_true', help="Verify but do not write anything.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        self.abandon_before = now - timedelta(minutes=options['abandon_after'])
+        self.client = payments.create_client(base_url=options['base_url'], pool_size=options['workers'])
+        dry_run = options['dry_run']
+
+        pending = Transaction.objects.filter(
+            status='pending',
+            created_at__lt=now - timedelta(minutes=options['older_than']),
+        ).select_related('cart')
+
+        totals = {
+            'scanned': 0, 'completed': 0, 'refund_required': 0, 'failed': 0, 'abandoned': 0,
+            'skipped': 0, 'unresolved': 0, 'errors': 0,
+        }
+        started = time.monotonic()
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(pending.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                results = list(pool.map(self.verify, batch))
+                counts = self.apply(batch, results, dry_run)
+                for name, count in counts.items():
+                    totals[name] += count
+                totals['scanned'] += len(batch)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{totals['scanned']} scanned ({totals['scanned'] / elapsed:.1f} tx/s): "
+                    f"{totals['completed']} completed, {totals['refund_required']} to refund, "
+                    f"{totals['failed']} failed, {totals['abandoned']} abandoned, "
+                    f"{totals['skipped']} settled elsewhere, {totals['unresolved']} still pending, "
+                    f"{totals['errors']} errors"
+                )
+
+        elapsed = time.monotonic() - started
+        prefix = "Dry run: " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}reconciled {totals['scanned']} pending transaction(s) in {elapsed:.2f}s."
+        ))
+
+    def verify(self, payment):
+        """Gateway data for the charge behind `payment`, {} if there is none, or None on errors."""
+        try:
+            response = self.client.verify_by_reference(payment.ref)
+            response_data = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+        if response_data.get('status') == 'success':
+            return response_data.get('data') or {}
+        if response.status_code in (400, 404):
+            # Flutterwave answers "No transaction was found for this id"
+            return {}
+        return None
+
+    def apply(self, batch, results, dry_run):
+        counts = dict.fromkeys(
+            ('completed', 'refund_required', 'failed', 'abandoned', 'skipped', 'unresolved', 'errors'), 0,
+        )
+
+        for payment, data in zip(batch, results):
+            if data is None:
+                counts['errors'] += 1
+            elif payment.matches_verification(data) or data.get('status') == 'failed':
+                if dry_run:
+                    counts['completed' if payment.matches_verification(data) else 'failed'] += 1
+                    continue
+                payment.apply_verification(data)
+                # Pending means another worker closed it before the failure could be recorded
+                counts[payment.status if payment.status != 'pending' else 'skipped'] += 1
+            elif not data and payment.created_at < self.abandon_before:
+                if dry_run:
+                    counts['abandoned'] += 1
+                    continue
+                closed = inventory.close(Transaction.objects.filter(pk=payment.pk), 'abandoned')
+                counts['abandoned' if closed else 'skipped'] += 1
+            else:
+                counts['unresolved'] += 1
+        return counts
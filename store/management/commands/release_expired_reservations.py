@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store import inventory
+from store.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire pending transactions whose stock holds ran out: return the held "
+        "units and close the transactions so they can no longer complete. Works in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Transactions expired per batch (default 500).")
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping instead of exiting when nothing is expired.")
+        parser.add_argument('--sleep', type=float, default=30, help="Seconds between sweeps with --loop (default 30).")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            expired = Transaction.objects.filter(
+                status='pending',
+                reservations__expires_at__lt=timezone.now(),
+            ).order_by('id').distinct()
+            ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            closed = len(inventory.close(Transaction.objects.filter(id__in=ids), 'expired')) if ids else 0
+            total += closed
+
+            if closed:
+                self.stdout.write(f"Expired {closed} transaction(s), {total} in total")
+            elif options['loop']:
+                time.sleep(options['sleep'])
+            else:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Expired {total} transaction(s) and returned their stock."))
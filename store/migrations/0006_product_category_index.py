@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_alter_cart_cart_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='store_product_cat_id_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cartitems(apps, schema_editor):
+    """Fold duplicate (cart, product) rows into one so the constraint can be added."""
+    CartItem = apps.get_model('store', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'product_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.filter(id=row['keep_id']).update(quantity=row['total'])
+        CartItem.objects.filter(cart_id=row['cart_id'], product_id=row['product_id']).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_similarproduct'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cartitems, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='store_cartitem_cart_product_uniq'),
+        ),
+    ]
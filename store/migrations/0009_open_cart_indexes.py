@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+
+
+def merge_duplicate_open_carts(apps, schema_editor):
+    """
+    Keep the most recently modified open cart of each user and fold the
+    others into it, so the partial unique index can be created. Large
+    databases should run `manage.py merge_duplicate_carts` beforehand.
+    """
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+    Transaction = apps.get_model('store', 'Transaction')
+
+    users = (
+        Cart.objects.filter(paid=False, user__isnull=False)
+        .values('user_id')
+        .annotate(open_carts=Count('id'))
+        .filter(open_carts__gt=1)
+        .values_list('user_id', flat=True)
+    )
+    for user_id in list(users):
+        keep, *duplicates = Cart.objects.filter(user_id=user_id, paid=False).order_by(F('modified_at').desc(nulls_last=True), '-id')
+        for other in duplicates:
+            other_quantity = CartItem.objects.filter(cart=other, product=OuterRef('product')).values('quantity')[:1]
+            CartItem.objects.filter(cart=keep, product__in=CartItem.objects.filter(cart=other).values('product')).update(
+                quantity=F('quantity') + Subquery(other_quantity)
+            )
+            CartItem.objects.filter(cart=other).exclude(
+                product__in=CartItem.objects.filter(cart=keep).values('product')
+            ).update(cart=keep)
+            # Deleting the cart would cascade to its payment records
+            Transaction.objects.filter(cart=other).update(cart=keep)
+            other.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_cartitem_cart_product_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'created_at'], name='store_tx_status_created_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_open_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('paid', False)), fields=('user',), name='store_cart_one_open_per_user'),
+        ),
+    ]
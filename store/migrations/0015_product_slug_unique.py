@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:30
+
+from django.db import migrations, models
+
+from store.slugs import SlugAllocator
+
+
+def deduplicate_slugs(apps, schema_editor):
+    """Give every product after the first with a given slug (or none at all) a fresh one."""
+    Product = apps.get_model('store', 'Product')
+    rows = list(Product.objects.order_by('id').values_list('id', 'slug', 'name'))
+
+    seen = set()
+    stale = []
+    for product_id, slug, name in rows:
+        if slug and slug not in seen:
+            seen.add(slug)
+        else:
+            stale.append((product_id, name))
+
+    allocator = SlugAllocator(seen)
+    Product.objects.bulk_update(
+        [Product(id=product_id, slug=allocator.allocate(name)) for product_id, name in stale],
+        ['slug'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Postgres keeps the weighted tsvector current itself through a generated column
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE store_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX store_product_search_idx ON store_product USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS store_product_search_idx",
+    "ALTER TABLE store_product DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: an external content FTS5 table mirrored from store_product by triggers
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE store_product_fts USING fts5(
+        name, description, content='store_product', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER store_product_fts_insert AFTER INSERT ON store_product BEGIN
+        INSERT INTO store_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_fts_delete AFTER DELETE ON store_product BEGIN
+        INSERT INTO store_product_fts(store_product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_fts_update AFTER UPDATE OF name, description ON store_product BEGIN
+        INSERT INTO store_product_fts(store_product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO store_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO store_product_fts(store_product_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS store_product_fts_update",
+    "DROP TRIGGER IF EXISTS store_product_fts_delete",
+    "DROP TRIGGER IF EXISTS store_product_fts_insert",
+    "DROP TABLE IF EXISTS store_product_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_product_slug_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='store.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+            ],
+            options={
+                'db_table': 'store_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
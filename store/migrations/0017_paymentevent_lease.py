@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentevent',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
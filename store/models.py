@@ -1,7 +1,17 @@
-from django.db import models
-from django.utils.text import slugify
+import logging
+from decimal import Decimal, InvalidOperation
+from uuid import uuid4
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.conf import settings
 
+from . import images, slugs
+
+logger = logging.getLogger(__name__)
+
 class Product(models.Model):
     CATEGORY = (
         ('electronics', "Electronics"),
@@ -11,27 +21,175 @@ class Product(models.Model):
     )
 
     name = models.CharField(max_length=100)
-    slug = models.SlugField(blank=True, null=True)
+    slug = models.SlugField(unique=True, blank=True, null=True)
     image = models.ImageField(upload_to='products/images')
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=15, choices=CATEGORY, blank=True, null=True)
+    stock = models.PositiveIntegerField(blank=True, null=True, help_text="Units available for sale. Leave empty to not track stock.")
+    # Resized copies of image, {variant: {format: name}}, filled in by store.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves category filtered, id ordered catalog pages
+            models.Index(fields=['category', 'id'], name='store_product_cat_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
-    
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The raw value: reading self.image would load the column when it is deferred
+        image = self.__dict__.get('image')
+        self._saved_image_name = getattr(image, 'name', image)
+        self._saved_ranking = self._ranking()
+
+    def _ranking(self):
+        # What store.similarity ranks on; deferred fields are left as None
+        price = self.__dict__.get('price')
+        if price is not None:
+            price = self._meta.get_field('price').to_python(price)
+        return price, self.__dict__.get('category')
+
+    def ranking_changed(self, created=False, update_fields=None):
+        """Whether the last save moved the product within the similarity index."""
+        if created:
+            return True
+        if update_fields is not None and not {'price', 'category'} & set(update_fields):
+            return False
+        return any(
+            field not in self.get_deferred_fields() and new != old
+            for field, new, old in zip(('price', 'category'), self._ranking(), self._saved_ranking)
+        )
+
+    def image_changed(self, update_fields=None):
+        if update_fields is not None and 'image' not in update_fields:
+            return False
+        if 'image' in self.get_deferred_fields() or not self.image:
+            return False
+        return self.image.name != self._saved_image_name or not self.image._committed
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
+        process_image = self.image_changed(kwargs.get('update_fields'))
+        if process_image:
+            if self.pk is not None:
+                images.delete_variants(self.image_variants)
+            self.image_variants = {}
+
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            self._save_with_new_slug(*args, **kwargs)
+        self._saved_ranking = self._ranking()
+        if process_image:
+            self._saved_image_name = self.image.name
+            images.generate_product_variants(self)
+
+    def _save_with_new_slug(self, *args, **kwargs):
+        # A concurrent save can claim the same slug between lookup and insert;
+        # the unique index catches it and the next free suffix is tried.
+        for attempt in range(3):
+            self.slug = slugs.next_free_slug(self.name, exclude_id=self.pk)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == 2 or not Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
+                    raise
+
+class ProductSearchEntry(models.Model):
+    """
+    The SQLite FTS5 table created by migration 0016, so store.search can join
+    it to products. Read only, and unused on Postgres, which searches the
+    search_vector column of store_product instead.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_entry',
+    )
+    name = models.TextField()
+    description = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'store_product_fts'
+
+class SimilarProduct(models.Model):
+    """
+    Precomputed top-N "similar products" for a product, ranked by how close
+    their price is within the same category. Maintained by store.similarity.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.DecimalField(max_digits=10, decimal_places=2)
 
-            if Product.objects.filter(slug=unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter += 1
-            self.slug = unique_slug
+    class Meta:
+        ordering = ['rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='store_similarproduct_product_rank_uniq'),
+        ]
 
-        super().save(*args, **kwargs)
+    def __str__(self):
+        return f'{self.similar_id} similar to {self.product_id} (#{self.rank})'
+
+class CheckoutInProgress(ValueError):
+    pass
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """Prefetch items together with their products in a single extra query."""
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=CartItem.objects.select_related('product'))
+        )
+
+    def with_totals(self):
+        """Annotate sum_total and num_of_items, computed by the database."""
+        return self.annotate(
+            sum_total=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price')),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            num_of_items=Coalesce(Sum('items__quantity'), 0),
+        )
+
+    def lock_for_edit(self, cart):
+        """
+        Lock `cart` for the rest of the current transaction and return it.
+        Raises CheckoutInProgress while a payment for it may still complete,
+        so the cart that gets paid is the cart that was charged.
+        """
+        cart = self.select_for_update().get(pk=cart.pk)
+        if cart.checkout_in_progress():
+            raise CheckoutInProgress('Cart has a payment in progress.')
+        return cart
+
+    def merge_guest_cart(self, user, cart_code):
+        """
+        Fold the open guest cart `cart_code` into the open cart of `user` and
+        return the user's cart, or None if there is no such guest cart.
+        A user without an open cart simply takes the guest cart over.
+        Raises CheckoutInProgress if either cart is being paid for.
+        """
+        with transaction.atomic():
+            guest = self.select_for_update().filter(cart_code=cart_code, paid=False, user__isnull=True).first()
+            if guest is None:
+                return None
+
+            cart = self.select_for_update().filter(user=user, paid=False).first()
+            if guest.checkout_in_progress() or (cart is not None and cart.checkout_in_progress()):
+                raise CheckoutInProgress('Cart has a payment in progress.')
+            if cart is None:
+                guest.user = user
+                guest.save(update_fields=['user', 'modified_at'])
+                return guest
+
+            cart.merge_from(guest)
+            return cart
 
 class Cart(models.Model):
     cart_code = models.CharField(max_length=36, unique=True)
@@ -40,17 +198,128 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     modified_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # At most one open cart per user; also serves the (user, paid=False) lookup
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(paid=False),
+                name='store_cart_one_open_per_user',
+            ),
+        ]
+
     def __str__(self):
         return self.cart_code
+
+    def checkout_in_progress(self):
+        """A pending payment started within STOCK_RESERVATION_TTL may still complete; the cart is frozen meanwhile."""
+        return self.transactions.filter(
+            status='pending', created_at__gt=timezone.now() - settings.STOCK_RESERVATION_TTL,
+        ).exists()
+
+    def touch(self):
+        """Bump modified_at after a change to the cart's items."""
+        self.modified_at = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(modified_at=self.modified_at)
+
+    def merge_from(self, other):
+        """
+        Move the items of `other` into this cart and delete `other`, using a
+        fixed number of set based statements. Quantities of products present
+        in both carts are summed. The transactions of `other` move here too,
+        so deleting it never cascades to payment records.
+        """
+        with transaction.atomic():
+            other_quantity = CartItem.objects.filter(cart=other, product=OuterRef('product')).values('quantity')[:1]
+            self.items.filter(product__in=other.items.values('product')).update(
+                quantity=F('quantity') + Subquery(other_quantity)
+            )
+            other.items.exclude(product__in=self.items.values('product')).update(cart=self)
+            other.transactions.update(cart=self)
+            other.delete()
+            self.save(update_fields=['modified_at'])
     
+class CartItemQuerySet(models.QuerySet):
+    def add_quantity(self, cart, product, quantity):
+        """
+        Add `quantity` units of `product` to `cart` and return the cart item.
+        The increment happens in SQL (quantity = quantity + n) and duplicate
+        inserts are rejected by the (cart, product) unique constraint, so
+        concurrent adds never lose updates and need no row locks.
+        """
+        items = self.filter(cart=cart, product=product)
+        if not items.update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    return self.create(cart=cart, product=product, quantity=quantity)
+            except IntegrityError:
+                # A concurrent request inserted the row first, add to it instead
+                items.update(quantity=F('quantity') + quantity)
+
+        cart_item = items.get()
+        cart_item.cart = cart
+        cart_item.product = product
+        return cart_item
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='store_cartitem_cart_product_uniq'),
+        ]
+
     def __str__(self):
         return f'{self.quantity} : {self.product.name} in cart {self.cart.id}'
     
+class TransactionManager(models.Manager):
+    def create_for_cart(self, cart, user, tax, currency):
+        """
+        Open a pending transaction for `cart`. The cart row is locked while the
+        total is summed by the database and the lines are copied, with their
+        current prices, onto the transaction, so concurrent cart edits cannot
+        make the charged amount and the recorded order disagree.
+        Stock of tracked products is reserved for the transaction.
+        Raises ValueError when the cart is empty, already paid or out of stock.
+        """
+        from . import inventory
+
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().get(pk=cart.pk)
+            if cart.paid:
+                raise ValueError('Cart already paid.')
+
+            # A new checkout supersedes the cart's earlier attempts: close them and return their holds
+            inventory.close(self.filter(cart=cart), 'abandoned')
+
+            amount = cart.items.aggregate(amount=Sum(F('quantity') * F('product__price')))['amount']
+            if amount is None:
+                raise ValueError('Cart is empty.')
+
+            payment = self.create(
+                ref=str(uuid4()),
+                cart=cart,
+                amount=amount + tax,
+                currency=currency,
+                user=user,
+                status='pending'
+            )
+            lines = list(cart.items.order_by('product_id').values_list('product_id', 'product__name', 'product__price', 'quantity', 'product__stock'))
+            TransactionItem.objects.bulk_create([
+                TransactionItem(transaction=payment, product_id=product_id, product_name=name, unit_price=price, quantity=quantity)
+                for product_id, name, price, quantity, stock in lines
+            ])
+            inventory.reserve(payment, [
+                (product_id, name, quantity, stock) for product_id, name, price, quantity, stock in lines
+            ])
+        return payment
+
 class Transaction(models.Model):
     ref = models.CharField(max_length=255, unique=True)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='transactions')
@@ -61,5 +330,143 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    objects = TransactionManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='store_tx_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Transaction {self.ref} - {self.status}'
+
+    def matches_verification(self, data):
+        """Whether Flutterwave's verified transaction `data` matches this transaction."""
+        try:
+            amount = Decimal(str(data.get('amount')))
+        except InvalidOperation:
+            return False
+        return (data.get('status') == 'successful' and
+                amount == self.amount and
+                data.get('currency') == self.currency)
+
+    def apply_verification(self, data, user=None):
+        """
+        Settle this transaction from Flutterwave's verified transaction `data`:
+        complete it and mark the cart paid when it matches, fail it when the
+        gateway reports a failed charge. Returns True when the payment is completed.
+
+        A matching charge for a transaction that was already closed (expired,
+        abandoned or failed) only completes if its units can be taken from stock
+        again and the cart is still unpaid; otherwise the transaction is marked
+        'refund_required' for the charge to be refunded.
+        """
+        from . import inventory
+        from .cache import invalidate_cart
+
+        if self.status == 'completed':
+            return True
+
+        if self.matches_verification(data):
+            with transaction.atomic():
+                # Serialises with the expiry sweeper and with a newer checkout closing this one
+                self.status = Transaction.objects.select_for_update().values_list('status', flat=True).get(pk=self.pk)
+                if self.status in ('completed', 'refund_required'):
+                    return self.status == 'completed'
+
+                cart = Cart.objects.select_for_update().get(pk=self.cart_id)
+                holds = self.reservations.all()
+                if cart.paid:
+                    settled = False
+                elif self.status == 'pending':
+                    settled = True
+                    inventory.consume(holds)
+                else:
+                    settled = inventory.retake(self)
+
+                if not settled:
+                    inventory.release(holds)
+                    self.status = 'refund_required'
+                    self.save(update_fields=['status', 'modified_at'])
+                    logger.error("Transaction %s was charged but cannot be fulfilled, it needs a refund", self.ref)
+                    return False
+
+                self.status = 'completed'
+                self.save(update_fields=['status', 'modified_at'])
+                cart.paid = True
+                if user is not None:
+                    cart.user = user
+                cart.save()
+                self.cart = cart
+            invalidate_cart(cart)
+            return True
+
+        if data.get('status') == 'failed':
+            with transaction.atomic():
+                if Transaction.objects.filter(pk=self.pk, status='pending').update(status='failed', modified_at=timezone.now()):
+                    self.status = 'failed'
+                    inventory.release(self.reservations.all())
+        return False
+
+class TransactionItem(models.Model):
+    """A cart line as it was when the transaction was opened."""
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True)
+    product_name = models.CharField(max_length=100)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.IntegerField()
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_name} @ {self.unit_price}'
+
+class StockReservation(models.Model):
+    """Units of a product held for a pending transaction, see store/inventory.py."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for {self.transaction_id} until {self.expires_at}'
+
+class PaymentEvent(models.Model):
+    """
+    A raw payment gateway webhook delivery. The webhook view only stores it;
+    the process_payment_events command settles the transactions in batches.
+    """
+    event_id = models.CharField(max_length=100, unique=True, blank=True, null=True)
+    event_type = models.CharField(max_length=50, blank=True)
+    tx_ref = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    # Set while a worker is verifying the event; expired leases are claimed again
+    leased_until = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # The worker's queue: unprocessed events in arrival order
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='store_paymentevent_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} {self.tx_ref} ({"processed" if self.processed_at else "pending"})'
+
+class IdempotencyKey(models.Model):
+    """A client supplied Idempotency-Key and the response it produced, see store/idempotency.py."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    endpoint = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='store_idempotencykey_uniq'),
+        ]
+
     def __str__(self):
-        return f'Transaction {self.ref} - {self.status}'
\ No newline at end of file
+        return f'{self.endpoint} {self.key}'
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the product catalog.
+    Ordering on the primary key keeps pages stable while products are added,
+    and lets the database seek straight to the cursor instead of counting rows.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+
+
+class SearchCursorPagination(ProductCursorPagination):
+    """Best matches first; the id breaks ties between equally ranked products."""
+    ordering = ('-rank', 'id')
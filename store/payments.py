@@ -0,0 +1,209 @@
+"""
+Flutterwave HTTP clients.
+
+One pooled requests.Session per process keeps connections to the gateway
+alive between payments, every call has connect/read timeouts, and only the
+idempotent verify calls are retried (with exponential backoff). The async
+views open an httpx.AsyncClient with the same policy for each request and
+close it when the request is done. Per endpoint latency
+histograms are kept in process and exposed through latency_stats().
+
+Point FLUTTERWAVE_BASE_URL at a local stub server to exercise it in tests.
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """Thread safe fixed bucket histogram of request latencies, in seconds."""
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'avg': self.total / self.count if self.count else 0.0,
+                'buckets': {f'le_{bound}': n for bound, n in zip(self.BUCKETS, self.counts)},
+            }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def _observe(endpoint, seconds):
+    with _histograms_lock:
+        histogram = _histograms.setdefault(endpoint, LatencyHistogram())
+    histogram.observe(seconds)
+    logger.debug("flutterwave %s took %.3fs", endpoint, seconds)
+
+
+def latency_stats():
+    """Latency histogram snapshot per gateway endpoint, for this process."""
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {endpoint: histogram.snapshot() for endpoint, histogram in histograms.items()}
+
+
+class FlutterwaveClient:
+    def __init__(self, secret_key, base_url, connect_timeout, read_timeout, pool_size=10, verify_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {secret_key}'
+
+        # Connection failures are retried for every method (the request never
+        # reached the gateway); read errors and 5xx/429 only for GET.
+        retry = Retry(
+            total=verify_retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _request(self, endpoint, method, path, **kwargs):
+        started = time.monotonic()
+        try:
+            return self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+        finally:
+            _observe(endpoint, time.monotonic() - started)
+
+    def initiate_payment(self, payload):
+        return self._request('initiate_payment', 'POST', '/payments', json=payload)
+
+    def verify_transaction(self, transaction_id):
+        return self._request('verify_transaction', 'GET', f'/transactions/{transaction_id}/verify')
+
+    def verify_by_reference(self, tx_ref):
+        return self._request('verify_by_reference', 'GET', '/transactions/verify_by_reference', params={'tx_ref': tx_ref})
+
+
+_ssl = None
+_ssl_lock = threading.Lock()
+
+
+def _ssl_context():
+    # Loading the CA bundle takes tens of milliseconds of CPU, too much to repeat
+    # on the event loop for every client. One context serves every loop and thread.
+    global _ssl
+    if _ssl is None:
+        with _ssl_lock:
+            if _ssl is None:
+                _ssl = httpx.create_ssl_context()
+    return _ssl
+
+
+class AsyncFlutterwaveClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    BACKOFF_FACTOR = 0.3
+
+    def __init__(self, secret_key, base_url, connect_timeout, read_timeout, pool_size=10, verify_retries=3):
+        self.verify_retries = verify_retries
+        ssl_context = _ssl_context()
+        # The transport retries failed connection attempts for every method
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            headers={'Authorization': f'Bearer {secret_key}'},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            verify=ssl_context,
+            transport=httpx.AsyncHTTPTransport(retries=verify_retries, verify=ssl_context),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    async def _request(self, endpoint, method, path, **kwargs):
+        started = time.monotonic()
+        try:
+            return await self.client.request(method, path, **kwargs)
+        finally:
+            _observe(endpoint, time.monotonic() - started)
+
+    async def initiate_payment(self, payload):
+        return await self._request('initiate_payment', 'POST', '/payments', json=payload)
+
+    async def verify_transaction(self, transaction_id):
+        for attempt in range(self.verify_retries + 1):
+            try:
+                response = await self._request('verify_transaction', 'GET', f'/transactions/{transaction_id}/verify')
+            except httpx.TransportError:
+                if attempt == self.verify_retries:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt == self.verify_retries:
+                    return response
+            await asyncio.sleep(self.BACKOFF_FACTOR * (2 ** attempt))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_client(base_url=None, pool_size=None):
+    """A new client configured from settings, e.g. for a command with its own worker pool."""
+    return FlutterwaveClient(
+        secret_key=settings.FLUTTERWAVE_SECRET_KEY,
+        base_url=base_url or settings.FLUTTERWAVE_BASE_URL,
+        connect_timeout=settings.FLUTTERWAVE_CONNECT_TIMEOUT,
+        read_timeout=settings.FLUTTERWAVE_READ_TIMEOUT,
+        pool_size=pool_size or settings.FLUTTERWAVE_POOL_SIZE,
+        verify_retries=settings.FLUTTERWAVE_VERIFY_RETRIES,
+    )
+
+
+def get_client():
+    """The process wide client, created on first use from settings."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def create_async_client():
+    """
+    A new async client configured from settings. Use it as `async with` so its
+    connections are closed with the request that opened them.
+    """
+    return AsyncFlutterwaveClient(
+        secret_key=settings.FLUTTERWAVE_SECRET_KEY,
+        base_url=settings.FLUTTERWAVE_BASE_URL,
+        connect_timeout=settings.FLUTTERWAVE_CONNECT_TIMEOUT,
+        read_timeout=settings.FLUTTERWAVE_READ_TIMEOUT,
+        verify_retries=settings.FLUTTERWAVE_VERIFY_RETRIES,
+    )
@@ -0,0 +1,52 @@
+"""
+Full-text product search.
+
+Postgres matches against the weighted search_vector column (name ranks above
+description) through its GIN index; SQLite joins the store_product_fts FTS5
+table (models.ProductSearchEntry). Both are created by migration 0016 and
+kept current by the database itself.
+Every term is matched as a prefix, so "blu sh" finds "Blue Shoes" while the
+user is still typing. Other backends fall back to a name substring filter.
+
+search_products() returns a queryset annotated with `rank` (higher is
+better), which SearchCursorPagination pages through.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+MAX_TERMS = 8
+
+
+def search_terms(q):
+    return re.findall(r'\w+', q.lower())[:MAX_TERMS]
+
+
+def search_products(queryset, q):
+    terms = search_terms(q)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.alias(
+            matched=RawSQL("search_vector @@ to_tsquery('english', %s)", [tsquery], output_field=BooleanField()),
+        ).filter(matched=True).annotate(
+            rank=RawSQL("ts_rank(search_vector, to_tsquery('english', %s))", [tsquery], output_field=FloatField()),
+        )
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # Joined through ProductSearchEntry so bm25 is computed once per match
+        return queryset.filter(search_entry__isnull=False).alias(
+            matched=RawSQL("store_product_fts MATCH %s", [match], output_field=BooleanField()),
+        ).filter(matched=True).annotate(
+            # bm25 is lower for better matches; the name weighs ten times the description
+            rank=RawSQL("-bm25(store_product_fts, 10.0, 1.0)", [], output_field=FloatField()),
+        )
+
+    for term in terms:
+        queryset = queryset.filter(name__icontains=term)
+    return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
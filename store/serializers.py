@@ -1,20 +1,47 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import Product, Cart, CartItem
+from .models import Product, Cart, CartItem, TransactionItem
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the resized copies in Product.image_variants, {variant: {format: url}}."""
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        urls = {}
+        for variant, names in (variants or {}).items():
+            urls[variant] = {}
+            for fmt, name in names.items():
+                url = default_storage.url(name)
+                urls[variant][fmt] = request.build_absolute_uri(url) if request else url
+        return urls
 
 class ProductSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'slug', 'image', 'description', 'category', 'price']
+        fields = ['id', 'name', 'slug', 'image', 'image_variants', 'description', 'category', 'price']
+
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, e.g. fields=['id', 'name', 'price']
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
 
 class DetailedProductSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
     similar_products = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'price', 'slug', 'image', 'description', 'similar_products']
+        fields = ['id', 'name', 'price', 'slug', 'image', 'image_variants', 'description', 'similar_products']
 
     def get_similar_products(self, product):
-        products = Product.objects.filter(category=product.category).exclude(id=product.id)
+        # Precomputed top-N list, see store.similarity
+        products = [link.similar for link in product.similar_links.select_related('similar')]
         serializer = ProductSerializer(products, many=True)
         return serializer.data
         
@@ -40,14 +67,15 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'cart_code', 'items', 'sum_total', 'num_of_items', 'created_at', 'modified_at']
 
     def get_sum_total(self, cart):
-        items = cart.items.all()
-        total = sum([item.product.price * item.quantity for item in items])
-        return total
+        # Annotated by Cart.objects.with_totals()
+        if hasattr(cart, 'sum_total'):
+            return cart.sum_total
+        return sum([item.product.price * item.quantity for item in cart.items.all()])
     
-    def get_num_of_items(self,cart):
-        items = cart.items.all()
-        total = sum([item.quantity for item in items])
-        return total
+    def get_num_of_items(self, cart):
+        if hasattr(cart, 'num_of_items'):
+            return cart.num_of_items
+        return sum([item.quantity for item in cart.items.all()])
 
 class SimpleCartSerializer(serializers.ModelSerializer):
     num_of_items = serializers.SerializerMethodField()
@@ -57,22 +85,42 @@ class SimpleCartSerializer(serializers.ModelSerializer):
         fields = ['id', 'cart_code', 'num_of_items']
 
     def get_num_of_items(self, cart):
-        num_of_items = sum([item.quantity for item in cart.items.all()])
-        return num_of_items
+        if hasattr(cart, 'num_of_items'):
+            return cart.num_of_items
+        return sum([item.quantity for item in cart.items.all()])
 
-class NewCartItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(serializers.ModelSerializer):
+    """A paid order line, as it was charged."""
     product = ProductSerializer(read_only=True)
     order_id = serializers.SerializerMethodField()
     order_date = serializers.SerializerMethodField()
 
     class Meta:
-        model = CartItem
-        fields = ['id', 'product', 'quantity', 'order_id', 'order_date']
+        model = TransactionItem
+        fields = ['id', 'product', 'product_name', 'unit_price', 'quantity', 'order_id', 'order_date']
 
-    def get_order_id(self, cartitem):
-        order_id = cartitem.cart.cart_code
-        return order_id
-    
-    def get_order_date(self, cartitem):
-        order_date = cartitem.cart.modified_at
-        return order_date
\ No newline at end of file
+    def get_order_id(self, item):
+        return item.transaction.cart.cart_code
+
+    def get_order_date(self, item):
+        return item.transaction.modified_at
+
+class CartBatchOperationSerializer(serializers.Serializer):
+    OPS = ('add', 'set', 'remove')
+
+    op = serializers.ChoiceField(choices=OPS)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add':
+            attrs.setdefault('quantity', 1)
+            if attrs['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Quantity must be at least 1.'})
+        elif attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'quantity is required for set.'})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    cart_code = serializers.CharField(max_length=36, required=False)
+    operations = CartBatchOperationSerializer(many=True, allow_empty=False, max_length=200)
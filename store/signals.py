@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Product, SimilarProduct
+from .similarity import refresh_after_save, refresh_after_delete
+from . import facets
+
+@receiver(post_save, sender=Product)
+def update_similar_products(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Runs before Product.save() records the new price and category
+    if raw or not instance.ranking_changed(created, update_fields):
+        return
+    refresh_after_save(instance)
+
+@receiver(pre_delete, sender=Product)
+def remember_similar_referrers(sender, instance, **kwargs):
+    # The rows pointing at this product are cascaded away with it
+    instance._similar_referrers = list(
+        SimilarProduct.objects.filter(similar=instance).values_list('product_id', flat=True)
+    )
+
+@receiver(post_delete, sender=Product)
+def refill_similar_products(sender, instance, **kwargs):
+    refresh_after_delete(getattr(instance, '_similar_referrers', []))
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_facets(sender, instance, **kwargs):
+    facets.bump_version()
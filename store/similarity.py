@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Abs
+
+from .models import Product, SimilarProduct
+
+SIMILAR_PRODUCTS_LIMIT = 8
+
+
+def _price(product):
+    # The instance may still hold the raw value it was assigned (e.g. a float)
+    return Product._meta.get_field('price').to_python(product.price)
+
+
+def rebuild_similar_products(product):
+    """
+    Recompute the ranked similar products of a single product:
+    the closest priced products from the same category.
+    """
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product=product).delete()
+        if not product.category:
+            return
+
+        candidates = (
+            Product.objects.filter(category=product.category)
+            .exclude(id=product.id)
+            .annotate(score=Abs(F('price') - Value(_price(product))))
+            .order_by('score', 'id')
+            .values_list('id', 'score')[:SIMILAR_PRODUCTS_LIMIT]
+        )
+        SimilarProduct.objects.bulk_create([
+            SimilarProduct(product=product, similar_id=similar_id, rank=rank, score=score)
+            for rank, (similar_id, score) in enumerate(candidates, start=1)
+        ])
+
+
+def _products_displaced_by(product):
+    """
+    Ids of products in the same category whose stored list would now include
+    `product`: lists that are not full yet, or whose worst entry is further
+    away in price than `product`. Lists are ranked by score, so the worst
+    entry of a full list is its last rank.
+    """
+    if not product.category:
+        return set()
+
+    worst = SimilarProduct.objects.filter(product=OuterRef('pk'), rank=SIMILAR_PRODUCTS_LIMIT).values('score')[:1]
+    return set(
+        Product.objects.filter(category=product.category)
+        .exclude(id=product.id)
+        .annotate(worst=Subquery(worst))
+        .filter(Q(worst__isnull=True) | Q(worst__gte=Abs(F('price') - Value(_price(product)))))
+        .values_list('id', flat=True)
+    )
+
+
+def refresh_after_save(product):
+    """
+    Incrementally update the index after `product` was created or changed:
+    rebuild its own list, the lists that referenced it before the change and
+    the lists it now ranks into.
+    """
+    affected = set(SimilarProduct.objects.filter(similar=product).values_list('product_id', flat=True))
+    affected |= _products_displaced_by(product)
+    affected.discard(product.id)
+
+    rebuild_similar_products(product)
+    for other in Product.objects.filter(id__in=affected).only('id', 'category', 'price'):
+        rebuild_similar_products(other)
+
+
+def refresh_after_delete(product_ids):
+    """Refill the lists that lost an entry when a product was deleted."""
+    for other in Product.objects.filter(id__in=product_ids).only('id', 'category', 'price'):
+        rebuild_similar_products(other)
+
+
+def rebuild_all(batch_size=1000):
+    """
+    Rebuild the whole index in memory, one category at a time.
+    Each product's nearest neighbours by price are found by walking outwards
+    from its position in the price sorted category, so no per product query
+    is needed. Returns the number of rows written.
+    """
+    written = 0
+    with transaction.atomic():
+        SimilarProduct.objects.all().delete()
+
+        categories = Product.objects.exclude(category__isnull=True).values_list('category', flat=True).distinct()
+        for category in categories:
+            rows = list(
+                Product.objects.filter(category=category).order_by('price', 'id').values_list('id', 'price')
+            )
+            links = []
+            for index, (product_id, price) in enumerate(rows):
+                lo, hi = index - 1, index + 1
+                for rank in range(1, SIMILAR_PRODUCTS_LIMIT + 1):
+                    left = price - rows[lo][1] if lo >= 0 else None
+                    right = rows[hi][1] - price if hi < len(rows) else None
+                    if left is None and right is None:
+                        break
+                    if right is None or (left is not None and left <= right):
+                        similar_id, score = rows[lo][0], left
+                        lo -= 1
+                    else:
+                        similar_id, score = rows[hi][0], right
+                        hi += 1
+                    links.append(SimilarProduct(product_id=product_id, similar_id=similar_id, rank=rank, score=score))
+
+            SimilarProduct.objects.bulk_create(links, batch_size=batch_size)
+            written += len(links)
+    return written
@@ -0,0 +1,46 @@
+"""
+Unique product slugs.
+
+SlugAllocator hands out slugs against an in-memory set of the ones already
+taken, so a bulk import needs a single query for the existing slugs instead of
+one exists() probe per row. Clashing names get -1, -2, ... suffixes.
+Single saves use next_free_slug(), which loads the taken slugs sharing the
+base with one prefix query on the unique slug index.
+"""
+from django.utils.text import slugify
+
+SLUG_MAX_LENGTH = 50
+
+
+def base_slug(text):
+    return slugify(text or '')[:SLUG_MAX_LENGTH].strip('-') or 'product'
+
+
+def with_suffix(base, n):
+    suffix = f'-{n}'
+    return f'{base[:SLUG_MAX_LENGTH - len(suffix)].rstrip("-")}{suffix}'
+
+
+class SlugAllocator:
+    def __init__(self, taken=()):
+        self.taken = set(taken)
+        self._next = {}
+
+    def allocate(self, text):
+        base = base_slug(text)
+        candidate = base
+        n = self._next.get(base, 1)
+        while candidate in self.taken:
+            candidate = with_suffix(base, n)
+            n += 1
+        self._next[base] = n
+        self.taken.add(candidate)
+        return candidate
+
+
+def next_free_slug(text, exclude_id=None):
+    from .models import Product
+
+    base = base_slug(text)
+    taken = Product.objects.filter(slug__startswith=base).exclude(pk=exclude_id).values_list('slug', flat=True)
+    return SlugAllocator(taken).allocate(base)
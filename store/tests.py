@@ -1,3 +1,380 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import Cart, CartItem, PaymentEvent, Product, SimilarProduct, StockReservation, Transaction
+from .management.commands.reconcile_transactions import Command as ReconcileCommand
+from .similarity import rebuild_all
+
+
+def successful_charge(payment):
+    return {'status': 'successful', 'amount': str(payment.amount), 'currency': payment.currency}
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Hot', price=Decimal('5.00'), image='x.jpg', stock=1)
+
+    def checkout(self):
+        cart = Cart.objects.create(cart_code=f'cart-{Cart.objects.count()}')
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        return Transaction.objects.create_for_cart(cart, None, tax=Decimal('0.00'), currency='USD')
+
+    def test_expired_transaction_cannot_sell_released_stock(self):
+        first = self.checkout()
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'expired')
+
+        second = self.checkout()
+        self.assertTrue(second.apply_verification(successful_charge(second)))
+        self.assertFalse(first.apply_verification(successful_charge(first)))
+
+        first.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(first.status, 'refund_required')
+        self.assertFalse(first.cart.paid)
+        self.assertEqual(self.product.stock, 0)
+
+    def test_late_charge_retakes_stock_when_available(self):
+        payment = self.checkout()
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+
+        self.assertTrue(payment.apply_verification(successful_charge(payment)))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_new_checkout_closes_the_earlier_one(self):
+        self.product.stock = 5
+        self.product.save()
+        first = self.checkout()
+        second = Transaction.objects.create_for_cart(first.cart, None, tax=Decimal('0.00'), currency='USD')
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'abandoned')
+        self.assertTrue(second.apply_verification(successful_charge(second)))
+        # The cart is paid, so a charge for the superseded attempt must be refunded
+        self.assertFalse(first.apply_verification(successful_charge(first)))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+
+
+class ProductListTests(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create([
+            Product(name=f'P{i}', slug=f'p{i}', price=Decimal('1.00'), image='x.jpg') for i in range(30)
+        ])
+
+    def test_sparse_fieldset_is_one_query(self):
+        # Deferred columns, image included, must not be loaded per instance
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/', {'fields': 'id,name,price'})
+        self.assertEqual(len(response.json()['results']), 24)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'price'})
+
+
+@override_settings(CART_CACHE_ALIAS='default')
+class CartQueryTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.cart = Cart.objects.create(cart_code='guest')
+        for i in range(3):
+            product = Product.objects.create(name=f'Item {i}', price=Decimal('2.50'), image='x.jpg')
+            CartItem.objects.create(cart=self.cart, product=product, quantity=i + 1)
+
+    def test_get_cart_query_count(self):
+        # One query for the cart and its totals, one to prefetch items with products
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/get_cart/', {'cart_code': 'guest'})
+        self.assertEqual(len(response.json()['items']), 3)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/get_cart/', {'cart_code': 'guest'})
+        self.assertEqual(cached.json(), response.json())
+
+    def test_get_cart_stat_query_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/get_cart_stat/', {'cart_code': 'guest'})
+        self.assertEqual(response.json()['num_of_items'], 6)
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/get_cart_stat/', {'cart_code': 'guest'})
+
+    def test_authenticated_cart_query_count(self):
+        user = get_user_model().objects.create_user(email='buyer@example.com', password='x')
+        self.cart.user = user
+        self.cart.save()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with self.assertNumQueries(2):
+            response = client.get('/api/get_cart/')
+        self.assertEqual(len(response.json()['items']), 3)
+        with self.assertNumQueries(0):
+            client.get('/api/get_cart/')
+
+    def test_writes_invalidate_cached_cart(self):
+        self.client.get('/api/get_cart_stat/', {'cart_code': 'guest'})
+        item = self.cart.items.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                '/api/update_quantity/', {'cart_code': 'guest', 'item_id': item.id, 'quantity': 10},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/get_cart_stat/', {'cart_code': 'guest'})
+        self.assertEqual(response.json()['num_of_items'], 15)
+
+
+class UnsharedCartCacheTests(TestCase):
+    def test_carts_are_not_cached_without_a_shared_backend(self):
+        # Without REDIS_URL the cart alias is a DummyCache, so no worker serves a stale copy
+        cart = Cart.objects.create(cart_code='guest')
+        self.client.get('/api/get_cart_stat/', {'cart_code': 'guest'})
+        CartItem.objects.create(
+            cart=cart, product=Product.objects.create(name='New', price=Decimal('1.00'), image='x.jpg'),
+        )
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/get_cart_stat/', {'cart_code': 'guest'})
+        self.assertEqual(response.json()['num_of_items'], 1)
+
+
+class SimilarProductTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Phone {i}', price=Decimal(10 + i * 3), category='electronics', image='x.jpg')
+            for i in range(12)
+        ]
+
+    def links(self):
+        return list(SimilarProduct.objects.order_by('product', 'rank').values_list('product', 'similar', 'rank'))
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        self.products[0].price = Decimal('27.50')
+        self.products[0].save()
+        self.products[5].category = 'fashion'
+        self.products[5].save()
+        Product.objects.create(name='Phone new', price=Decimal('20.20'), category='electronics', image='x.jpg')
+        incremental = self.links()
+
+        rebuild_all()
+        self.assertEqual(incremental, self.links())
+
+    def test_name_only_edit_skips_the_refresh(self):
+        product = Product.objects.get(pk=self.products[3].pk)
+        product.name = 'Renamed'
+        with self.assertNumQueries(1):
+            product.save()
+
+    def test_sparse_instance_edit_skips_the_refresh(self):
+        product = Product.objects.only('id', 'name', 'slug').get(pk=self.products[3].pk)
+        product.name = 'Renamed'
+        with self.assertNumQueries(1):
+            product.save()
+
+
+class CheckoutFreezeTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Mug', price=Decimal('4.00'), image='x.jpg')
+        self.cart = Cart.objects.create(cart_code='guest')
+        self.item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.payment = Transaction.objects.create_for_cart(self.cart, None, tax=Decimal('0.00'), currency='USD')
+
+    def edit(self):
+        return self.client.patch(
+            '/api/update_quantity/', {'cart_code': 'guest', 'item_id': self.item.id, 'quantity': 3},
+            content_type='application/json',
+        )
+
+    def test_cart_is_frozen_while_payment_is_pending(self):
+        self.assertEqual(self.edit().status_code, 409)
+        response = self.client.post('/api/add_item/', {'cart_code': 'guest', 'product_id': self.product.id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.delete(f'/api/delete_cartitem/{self.item.id}/?cart_code=guest').status_code, 409)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 1)
+
+    def test_cart_thaws_when_payment_fails_or_hold_runs_out(self):
+        self.payment.apply_verification({'status': 'failed'})
+        self.assertEqual(self.edit().status_code, 200)
+
+        payment = Transaction.objects.create_for_cart(self.cart, None, tax=Decimal('0.00'), currency='USD')
+        Transaction.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.edit().status_code, 200)
+
+
+class ReconcileTransactionsTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name='Desk', price=Decimal('50.00'), image='x.jpg', stock=1)
+        cart = Cart.objects.create(cart_code='guest')
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        self.payment = Transaction.objects.create_for_cart(cart, None, tax=Decimal('0.00'), currency='USD')
+        self.command = ReconcileCommand()
+        self.command.abandon_before = timezone.now() + timedelta(minutes=1)
+
+    def test_settled_meanwhile_is_not_overwritten(self):
+        scanned = Transaction.objects.get(pk=self.payment.pk)
+        self.payment.apply_verification(successful_charge(self.payment))
+
+        counts = self.command.apply([scanned], [{'status': 'failed'}], dry_run=False)
+        self.assertEqual(counts['skipped'], 1)
+        self.assertEqual(Transaction.objects.get(pk=self.payment.pk).status, 'completed')
+
+    def test_charge_for_a_transaction_closed_meanwhile_goes_through_verification(self):
+        scanned = Transaction.objects.get(pk=self.payment.pk)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+        Product.objects.update(stock=0)
+
+        counts = self.command.apply([scanned], [successful_charge(self.payment)], dry_run=False)
+        self.assertEqual(counts['refund_required'], 1)
+        self.assertFalse(Cart.objects.get(pk=self.payment.cart_id).paid)
+
+    def test_abandons_only_pending_transactions(self):
+        counts = self.command.apply([self.payment], [{}], dry_run=False)
+        self.assertEqual(counts['abandoned'], 1)
+        self.assertEqual(Product.objects.get().stock, 1)
+
+        counts = self.command.apply([self.payment], [{}], dry_run=False)
+        self.assertEqual(counts['skipped'], 1)
+
+
+class MergeCartTests(TestCase):
+    def test_merging_keeps_the_guest_carts_transactions(self):
+        user = get_user_model().objects.create_user(email='buyer@example.com', password='x')
+        product = Product.objects.create(name='Pen', price=Decimal('1.00'), image='x.jpg')
+        own = Cart.objects.create(cart_code='own', user=user)
+        guest = Cart.objects.create(cart_code='guest')
+        CartItem.objects.create(cart=guest, product=product, quantity=1)
+        payment = Transaction.objects.create_for_cart(guest, None, tax=Decimal('0.00'), currency='USD')
+        Transaction.objects.filter(pk=payment.pk).update(status='expired')
+
+        self.assertEqual(Cart.objects.merge_guest_cart(user, 'guest'), own)
+        payment.refresh_from_db()
+        self.assertEqual(payment.cart, own)
+        self.assertEqual(payment.items.count(), 1)
+
+
+class ImportProductsTests(TestCase):
+    def import_csv(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.unlink, f.name)
+        call_command('import_products', f.name, '--skip-similar', stdout=StringIO(), stderr=StringIO())
+
+    def test_update_only_writes_columns_in_the_file(self):
+        product = Product.objects.create(
+            name='Lamp', slug='lamp', price=Decimal('5.00'), description='Warm light', category='electronics',
+            stock=3, image='old.jpg', image_variants={'card': {'webp': 'old-card.webp'}},
+        )
+        self.import_csv('name,slug,price,image\nLamp v2,lamp,6.00,new.jpg\n')
+
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.price, product.image.name), ('Lamp v2', Decimal('6.00'), 'new.jpg'))
+        self.assertEqual((product.description, product.category, product.stock), ('Warm light', 'electronics', 3))
+        self.assertEqual(product.image_variants, {})
+
+    def test_unchanged_image_keeps_its_variants(self):
+        Product.objects.create(name='Lamp', slug='lamp', price=Decimal('5.00'), image='same.jpg',
+                               image_variants={'card': {'webp': 'card.webp'}})
+        self.import_csv('name,slug,price,image,stock\nLamp,lamp,5.00,same.jpg,\n')
+
+        product = Product.objects.get(slug='lamp')
+        self.assertEqual(product.image_variants, {'card': {'webp': 'card.webp'}})
+        self.assertIsNone(product.stock)
+
+
+class FacetCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        Product.objects.create(name='Mug', price=Decimal('4.00'), category='groceries', image='x.jpg')
+
+    def counts(self):
+        return self.client.get('/api/products/facets/').json()['categories']
+
+    @override_settings(FACETS_CACHE_ALIAS='default')
+    def test_product_writes_invalidate_cached_facets(self):
+        self.counts()
+        with self.assertNumQueries(0):
+            self.counts()
+        Product.objects.create(name='Tea', price=Decimal('3.00'), category='groceries', image='x.jpg')
+        self.assertEqual(self.counts(), [{'category': 'groceries', 'count': 2}])
+
+    def test_not_cached_without_a_shared_backend(self):
+        # Another process (e.g. import_products) could not bump a per-process version
+        self.counts()
+        Product.objects.bulk_create([Product(name='Tea', slug='tea', price=Decimal('3.00'), category='groceries', image='x.jpg')])
+        self.assertEqual(self.counts(), [{'category': 'groceries', 'count': 2}])
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        storages = {**settings.STORAGES, 'default': {**settings.STORAGES['default'], 'OPTIONS': {'location': media}}}
+        overrides = override_settings(MEDIA_ROOT=media, STORAGES=storages, IMAGE_WORKERS=0,
+                                      IMAGE_VARIANTS={'card': (20, 20)}, IMAGE_VARIANT_FORMATS=['webp'])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def upload(self, name, fmt):
+        buffer = BytesIO()
+        Image.new('RGB', (60, 40), 'red').save(buffer, fmt)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def create(self, name, fmt):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name=name, price=Decimal('1.00'), image=self.upload(name, fmt))
+        product.refresh_from_db()
+        return product
+
+    def test_same_stem_different_extension_do_not_share_variants(self):
+        jpg, png = self.create('shoe.jpg', 'JPEG'), self.create('shoe.png', 'PNG')
+        self.assertNotEqual(jpg.image_variants['card']['webp'], png.image_variants['card']['webp'])
+
+    def test_replacing_an_image_deletes_the_old_variants(self):
+        product = self.create('lamp.jpg', 'JPEG')
+        old = product.image_variants['card']['webp']
+        self.assertTrue(default_storage.exists(old))
+
+        product.image = self.upload('lamp2.jpg', 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(default_storage.exists(old))
+        product.refresh_from_db()
+        self.assertTrue(default_storage.exists(product.image_variants['card']['webp']))
+
+
+@override_settings(FLUTTERWAVE_WEBHOOK_HASH='secret')
+class FlutterwaveWebhookTests(TestCase):
+    def post(self, signature):
+        return self.client.post(
+            '/api/webhooks/flutterwave/', {'event': 'charge.completed', 'data': {'id': 1, 'tx_ref': 'r1'}},
+            content_type='application/json', HTTP_VERIF_HASH=signature,
+        )
+
+    def test_non_ascii_signature_is_rejected(self):
+        self.assertEqual(self.post('sécret').status_code, 401)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_valid_signature_stores_the_event(self):
+        self.assertEqual(self.post('secret').status_code, 200)
+        self.assertEqual(PaymentEvent.objects.get().tx_ref, 'r1')
@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('products/', views.products, name='products'),
+    path('products/search/', views.search_products, name='search_products'),
+    path('products/facets/', views.product_facets, name='product_facets'),
     path('product_detail/<slug:slug>/', views.product_detail, name='product_detail'),
     path('add_item/', views.add_item, name='add_item'),
     path('product_in_cart/', views.product_in_cart, name='product_in_cart'),
@@ -10,6 +12,11 @@ urlpatterns = [
     path('get_cart/', views.get_cart, name='get_cart'),
     path('update_quantity/', views.update_quantity, name='update_quantity'),
     path('delete_cartitem/<int:item_id>/', views.delete_cartitem, name='delete_cartitem'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
+    path('cart/merge/', views.merge_cart, name='merge_cart'),
     path('initiate_payment/', views.initiate_payment, name='initiate_payment'),
-    path('payment_callback', views.payment_callback, name='payment_callback')
+    path('payment_callback', views.payment_callback, name='payment_callback'),
+    path('async/initiate_payment/', views.initiate_payment_async, name='initiate_payment_async'),
+    path('async/payment_callback', views.payment_callback_async, name='payment_callback_async'),
+    path('webhooks/flutterwave/', views.flutterwave_webhook, name='flutterwave_webhook'),
 ]
\ No newline at end of file
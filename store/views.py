@@ -1,28 +1,42 @@
 from uuid import uuid4
+import hmac
+import json
 import uuid
 from decimal import Decimal
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 
 from django.conf import settings
+from django.db import transaction as db_transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
 
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
-from .models import Product, Cart, CartItem, Transaction
+from .models import Product, Cart, CartItem, CheckoutInProgress, Transaction, PaymentEvent
 from .serializers import (
     ProductSerializer,
     DetailedProductSerializer,
     CartSerializer,
     CartItemSerializer,
-    SimpleCartSerializer
+    SimpleCartSerializer,
+    CartBatchSerializer
 )
-from users.models import User
+from .pagination import ProductCursorPagination, SearchCursorPagination
+from . import facets, idempotency, payments, search
+from .cache import get_cached_cart, set_cached_cart, invalidate, invalidate_cart
+from users.models import User, Profile
 
 
 BASE_URL = settings.REACT_BASE_URL
@@ -35,7 +49,7 @@ def get_or_create_cart(request):
     - For guests: get/create by cart_code and paid=False; generate cart_code if missing
     """
     if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user, paid=False)
+        cart, created = Cart.objects.get_or_create(user=request.user, paid=False, defaults={'cart_code': str(uuid4())})
     else:
         cart_code = request.query_params.get('cart_code') or request.data.get('cart_code')
         if not cart_code:
@@ -44,16 +58,156 @@ def get_or_create_cart(request):
     return cart
 
 
+def build_payment_payload(tx_ref, amount, currency, email, phone):
+    return {
+        'tx_ref': tx_ref,
+        'amount': str(amount),
+        'currency': currency,
+        'redirect_url': f'{BASE_URL}/payment-status/',
+        'customer': {
+            'email': email,
+            'phonenumber': phone or ''
+        },
+        'customizations': {
+            'title': "Duka+ Payment"
+        }
+    }
+
+
+def get_open_cart(request, queryset=None):
+    """
+    Look up the open Cart for a read-only request without creating one:
+    - For authenticated users: by user and paid=False
+    - For guests: by cart_code and paid=False
+    Returns None when the visitor has no cart row yet.
+    """
+    if queryset is None:
+        queryset = Cart.objects.all()
+
+    if request.user.is_authenticated:
+        return queryset.filter(user=request.user, paid=False).first()
+
+    cart_code = request.query_params.get('cart_code') or request.data.get('cart_code')
+    if not cart_code:
+        return None
+    return queryset.filter(cart_code=cart_code, paid=False).first()
+
+
+def empty_cart_data(cart_code):
+    """
+    CartSerializer output for a cart that only exists client side. The row is
+    created with this cart_code by the first mutation (see get_or_create_cart).
+    """
+    return {
+        'id': None,
+        'cart_code': cart_code,
+        'items': [],
+        'sum_total': Decimal('0.00'),
+        'num_of_items': 0,
+        'created_at': None,
+        'modified_at': None,
+    }
+
+
+def requested_fields(request):
+    """
+    The sparse fieldset asked for with ?fields=, limited to ProductSerializer
+    fields. None when not given, an empty list when none of them are valid.
+    """
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return [f for f in fields.split(',') if f in ProductSerializer.Meta.fields]
+
+
 @extend_schema(
-    summary="List all products",
+    summary="List products (cursor paginated)",
+    parameters=[
+        OpenApiParameter(name="cursor", description="Opaque cursor from a previous page's next/previous link", required=False, type=OpenApiTypes.STR),
+        OpenApiParameter(name="page_size", description="Products per page (max 100)", required=False, type=OpenApiTypes.INT),
+        OpenApiParameter(name="category", description="Only return products in this category", required=False, type=OpenApiTypes.STR),
+        OpenApiParameter(name="fields", description="Comma separated list of fields to return, e.g. id,name,price", required=False, type=OpenApiTypes.STR),
+    ],
     responses=ProductSerializer(many=True)
 )
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def products(request):
     products = Product.objects.all()
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+
+    category = request.query_params.get('category')
+    if category:
+        products = products.filter(category=category)
+
+    fields = requested_fields(request)
+    if fields == []:
+        return Response({'error': 'No valid fields requested.'}, status=status.HTTP_400_BAD_REQUEST)
+    if fields:
+        # Only load the requested columns; id is always needed for the cursor.
+        products = products.only('id', *fields)
+
+    paginator = ProductCursorPagination()
+    page = paginator.paginate_queryset(products, request)
+    serializer = ProductSerializer(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@extend_schema(
+    summary="Search products by name and description (cursor paginated)",
+    parameters=[
+        OpenApiParameter(name="q", description="Search text; every word is matched as a prefix", required=True, type=OpenApiTypes.STR),
+        OpenApiParameter(name="cursor", description="Opaque cursor from a previous page's next/previous link", required=False, type=OpenApiTypes.STR),
+        OpenApiParameter(name="page_size", description="Products per page (max 100)", required=False, type=OpenApiTypes.INT),
+        OpenApiParameter(name="category", description="Only return products in this category", required=False, type=OpenApiTypes.STR),
+        OpenApiParameter(name="fields", description="Comma separated list of fields to return, e.g. id,name,price", required=False, type=OpenApiTypes.STR),
+    ],
+    responses=ProductSerializer(many=True)
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_products(request):
+    q = request.query_params.get('q', '').strip()
+    if not search.search_terms(q):
+        return Response({'error': 'Search text (q) is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    products = Product.objects.all()
+    category = request.query_params.get('category')
+    if category:
+        products = products.filter(category=category)
+
+    fields = requested_fields(request)
+    if fields == []:
+        return Response({'error': 'No valid fields requested.'}, status=status.HTTP_400_BAD_REQUEST)
+    if fields:
+        products = products.only('id', *fields)
+
+    # Best matches first, see store.search
+    paginator = SearchCursorPagination()
+    page = paginator.paginate_queryset(search.search_products(products, q), request)
+    serializer = ProductSerializer(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@extend_schema(
+    summary="Category counts and price histogram for the product filters",
+    parameters=[
+        OpenApiParameter(name="category", description="Selected category; price figures only cover it", required=False, type=OpenApiTypes.STR),
+        OpenApiParameter(name="q", description="Only count products matching this search text", required=False, type=OpenApiTypes.STR),
+    ],
+    responses=OpenApiTypes.OBJECT
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_facets(request):
+    category = request.query_params.get('category') or None
+    q = request.query_params.get('q', '').strip() or None
+
+    products = Product.objects.all()
+    if q:
+        products = Product.objects.filter(id__in=search.search_products(Product.objects.all(), q).values('id'))
+
+    # Cached per filter set until the next product write, see store.facets
+    return Response(facets.get_facets(products, category, q))
 
 
 @extend_schema(
@@ -76,7 +230,8 @@ def product_detail(request, slug):
     request=CartItemSerializer,
     responses={
         201: OpenApiTypes.OBJECT,
-        400: OpenApiTypes.OBJECT
+        400: OpenApiTypes.OBJECT,
+        409: OpenApiTypes.OBJECT
     },
     examples=[
         OpenApiExample(
@@ -101,12 +256,11 @@ def add_item(request):
 
         product = get_object_or_404(Product, id=product_id)
 
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            cart_item.quantity += quantity
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
+        with db_transaction.atomic():
+            Cart.objects.lock_for_edit(cart)
+            cart_item = CartItem.objects.add_quantity(cart, product, quantity)
+            cart.touch()
+        invalidate_cart(cart)
 
         serializer = CartItemSerializer(cart_item)
         response_data = serializer.data
@@ -116,6 +270,8 @@ def add_item(request):
 
         return Response(response_data, status=status.HTTP_201_CREATED)
 
+    except CheckoutInProgress as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -123,60 +279,53 @@ def add_item(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def product_in_cart(request):
-    cart = get_or_create_cart(request)
+    cart = get_open_cart(request)
 
     product_id = request.query_params.get('product_id')
     if not product_id:
         return Response({'error': 'product_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
     product = get_object_or_404(Product, id=product_id)
-    exists = CartItem.objects.filter(cart=cart, product=product).exists()
+    exists = cart is not None and CartItem.objects.filter(cart=cart, product=product).exists()
     return Response({'product_in_cart': exists})
 
 
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
-from rest_framework.response import Response
-
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_cart(request):
-    cart_code = request.query_params.get('cart_code')
+    # Reads never write: visitors without a cart row get an empty virtual cart
+    data = get_cached_cart(request, 'full')
+    if data is not None:
+        return Response(data)
 
-    if request.user.is_authenticated:
-        # Logged-in user: retrieve or create their single cart
-        cart = Cart.objects.filter(user=request.user, paid=False).first()
-        if not cart:
-            cart = Cart.objects.create(
-                user=request.user,
-                cart_code=uuid.uuid4().hex
-            )
-    else:
-        # Guest: retrieve or create by cart_code
-        if cart_code:
-            cart = Cart.objects.filter(cart_code=cart_code, paid=False).first()
-        else:
-            cart = None
-
-        if not cart:
-            cart = Cart.objects.create(cart_code=uuid.uuid4().hex)
+    cart = get_open_cart(request, Cart.objects.with_items().with_totals())
+    if not cart:
+        return Response(empty_cart_data(uuid.uuid4().hex))
 
     serializer = CartSerializer(cart)
+    set_cached_cart(request, 'full', serializer.data)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_cart_stat(request):
-    cart_code = request.query_params.get('cart_code')
-    cart = Cart.objects.get(cart_code=cart_code, paid=False)
+    data = get_cached_cart(request, 'stat')
+    if data is not None:
+        return Response(data)
+
+    cart = get_open_cart(request, Cart.objects.with_totals())
+    if not cart:
+        return Response({'id': None, 'cart_code': request.query_params.get('cart_code'), 'num_of_items': 0})
+
     serializer = SimpleCartSerializer(cart)
+    set_cached_cart(request, 'stat', serializer.data)
     return Response(serializer.data)
 
 @api_view(['PATCH'])
 @permission_classes([AllowAny])
 def update_quantity(request):
     try:
-        cart = get_or_create_cart(request)
+        cart = get_open_cart(request)
 
         cartitem_id = request.data.get('item_id')
         quantity = request.data.get('quantity')
@@ -188,13 +337,22 @@ def update_quantity(request):
         if quantity < 1:
             return Response({'error': 'Quantity must be at least 1.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart_item = get_object_or_404(CartItem, id=cartitem_id, cart=cart)
-        cart_item.quantity = quantity
-        cart_item.save()
+        if cart is None:
+            return Response({"error": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        cart_item = get_object_or_404(CartItem.objects.select_related('product'), id=cartitem_id, cart=cart)
+        with db_transaction.atomic():
+            Cart.objects.lock_for_edit(cart)
+            cart_item.quantity = quantity
+            cart_item.save()
+            cart.touch()
+        invalidate_cart(cart)
 
         serializer = CartItemSerializer(cart_item)
         return Response({'data': serializer.data, 'message': "Cart item updated successfully!"}, status=status.HTTP_200_OK)
 
+    except CheckoutInProgress as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -202,69 +360,189 @@ def update_quantity(request):
 @api_view(['DELETE'])
 @permission_classes([AllowAny])
 def delete_cartitem(request, item_id):
-    cart = get_or_create_cart(request)
+    cart = get_open_cart(request)
+    if cart is None:
+        return Response({"error": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
 
     try:
-        cart_item = CartItem.objects.get(id=item_id, cart=cart)
-        cart_item.delete()
+        with db_transaction.atomic():
+            Cart.objects.lock_for_edit(cart)
+            CartItem.objects.get(id=item_id, cart=cart).delete()
+            cart.touch()
+        invalidate_cart(cart)
         return Response(status=status.HTTP_204_NO_CONTENT)
     except CartItem.DoesNotExist:
         return Response({"error": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
+    except CheckoutInProgress as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
 
 
+@extend_schema(
+    summary="Apply several cart changes at once",
+    request=CartBatchSerializer,
+    responses={
+        200: CartSerializer,
+        400: OpenApiTypes.OBJECT,
+        409: OpenApiTypes.OBJECT
+    },
+    examples=[
+        OpenApiExample(
+            "Cart sync example",
+            value={
+                "cart_code": "abc123",
+                "operations": [
+                    {"op": "add", "product_id": 1, "quantity": 2},
+                    {"op": "set", "product_id": 3, "quantity": 1},
+                    {"op": "remove", "product_id": 4}
+                ]
+            }
+        )
+    ]
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cart_batch(request):
+    serializer = CartBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    operations = serializer.validated_data['operations']
+
+    product_ids = {op['product_id'] for op in operations}
+    missing = product_ids - set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    if missing:
+        return Response({'error': f'Unknown product_id(s): {sorted(missing)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    with db_transaction.atomic():
+        cart = get_or_create_cart(request)
+        # Lock the cart so concurrent batches on it are applied one after the other
+        try:
+            cart = Cart.objects.lock_for_edit(cart)
+        except CheckoutInProgress as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        existing = {item.product_id: item for item in cart.items.all()}
+
+        # Replay the operations in memory, then write the net result
+        quantities = {product_id: item.quantity for product_id, item in existing.items()}
+        for op in operations:
+            product_id = op['product_id']
+            if op['op'] == 'add':
+                quantities[product_id] = quantities.get(product_id, 0) + op['quantity']
+            elif op['op'] == 'set':
+                quantities[product_id] = op['quantity']
+            else:
+                quantities[product_id] = 0
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = existing.get(product_id)
+            if quantity == 0:
+                if item:
+                    to_delete.append(item.id)
+            elif item is None:
+                to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_delete:
+            CartItem.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        cart.touch()
+        invalidate_cart(cart)
+
+    cart = Cart.objects.with_items().with_totals().get(pk=cart.pk)
+    return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    summary="Merge a guest cart into the logged-in user's cart",
+    request=OpenApiTypes.OBJECT,
+    responses={
+        200: CartSerializer,
+        400: OpenApiTypes.OBJECT,
+        404: OpenApiTypes.OBJECT,
+        409: OpenApiTypes.OBJECT
+    },
+    examples=[
+        OpenApiExample(
+            "Merge cart example",
+            value={"cart_code": "abc123"}
+        )
+    ]
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def merge_cart(request):
+    cart_code = request.data.get('cart_code')
+    if not cart_code:
+        return Response({'error': 'cart_code is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        cart = Cart.objects.merge_guest_cart(request.user, cart_code)
+    except CheckoutInProgress as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    if cart is None:
+        return Response({'error': 'Guest cart not found.'}, status=status.HTTP_404_NOT_FOUND)
+    invalidate(request.user.id, cart_code)
+
+    cart = Cart.objects.with_items().with_totals().get(pk=cart.pk)
+    return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    summary="Start a Flutterwave payment for the user's cart",
+    parameters=[
+        OpenApiParameter(name="Idempotency-Key", location=OpenApiParameter.HEADER, description="Retries with the same key replay the first response instead of starting another payment", required=False, type=OpenApiTypes.STR)
+    ],
+    responses=OpenApiTypes.OBJECT
+)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def initiate_payment(request):
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return start_payment(request)
+    if len(key) > 255:
+        return Response({'error': 'Idempotency-Key must be at most 255 characters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    record, replay = idempotency.begin(request.user, 'initiate_payment', key)
+    if replay is not None:
+        replay_status, replay_body = replay
+        return Response(replay_body, status=replay_status, headers={'Idempotent-Replayed': 'true'})
+
+    try:
+        response = start_payment(request)
+    except Exception:
+        idempotency.release(record)
+        raise
+
+    if response.status_code >= 500:
+        idempotency.release(record)
+    else:
+        idempotency.complete(record, response.status_code, response.data)
+    return response
+
+
+def start_payment(request):
     try:
         user = request.user
         cart = get_or_create_cart(request)
 
-        if cart.paid:
-            return Response({'error': 'Cart already paid.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Calculate total amount
-        amount = sum(item.quantity * item.product.price for item in cart.items.all())
         tax = Decimal('4.00')
-        total_amount = amount + tax
         currency = "USD"
-        redirect_url = f'{BASE_URL}/payment-status/'
-
-        # Generate transaction reference
-        tx_ref = str(uuid4())
-
-        transaction = Transaction.objects.create(
-            ref=tx_ref,
-            cart=cart,
-            amount=total_amount,
-            currency=currency,
-            user=user,
-            status='pending'
-        )
-
-        flutterwave_payload = {
-            'tx_ref': tx_ref,
-            'amount': str(total_amount),
-            'currency': currency,
-            'redirect_url': redirect_url,
-            'customer': {
-                'email': user.email,
-                'phonenumber': getattr(user.profile, 'phone', '') if hasattr(user, 'profile') else ''
-            },
-            'customizations': {
-                'title': "Duka+ Payment"
-            }
-        }
+        try:
+            transaction = Transaction.objects.create_for_cart(cart, user, tax=tax, currency=currency)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        tx_ref, total_amount = transaction.ref, transaction.amount
 
-        headers = {
-            'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}',
-            'Content-Type': 'application/json'
-        }
+        phone = getattr(user.profile, 'phone', '') if hasattr(user, 'profile') else ''
+        flutterwave_payload = build_payment_payload(tx_ref, total_amount, currency, user.email, phone)
 
-        response = requests.post(
-            'https://api.flutterwave.com/v3/payments',
-            json=flutterwave_payload,
-            headers=headers
-        )
+        response = payments.get_client().initiate_payment(flutterwave_payload)
 
         if response.status_code == 200:
             return Response(response.json(), status=status.HTTP_200_OK)
@@ -275,6 +553,38 @@ def initiate_payment(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def flutterwave_webhook(request):
+    """
+    Flutterwave webhook: authenticate the delivery, store it and acknowledge
+    right away. Transactions are settled by the process_payment_events command.
+    """
+    secret_hash = settings.FLUTTERWAVE_WEBHOOK_HASH
+    signature = request.headers.get('verif-hash', '')
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    if not secret_hash or not hmac.compare_digest(signature.encode(), secret_hash.encode()):
+        return Response({'error': 'Invalid signature.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    payload = request.data
+    if not isinstance(payload, dict):
+        return Response({'error': 'Invalid payload.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    event_type = str(payload.get('event') or payload.get('event.type') or '')
+    data = payload.get('data') or {}
+    event_id = f"{event_type}:{data['id']}" if data.get('id') else None
+
+    # Redelivered events share their event_id and are stored only once
+    defaults = {'event_type': event_type, 'tx_ref': str(data.get('tx_ref') or ''), 'payload': payload}
+    if event_id:
+        PaymentEvent.objects.get_or_create(event_id=event_id, defaults=defaults)
+    else:
+        PaymentEvent.objects.create(**defaults)
+
+    return Response({'status': 'received'}, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def payment_callback(request):
@@ -284,11 +594,11 @@ def payment_callback(request):
     user = request.user
 
     if status_param == 'successful':
-        headers = {
-            'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}'
-        }
-        response = requests.get(f'https://api.flutterwave.com/v3/transactions/{transaction_id}/verify', headers=headers)
-        response_data = response.json()
+        try:
+            response = payments.get_client().verify_transaction(transaction_id)
+            response_data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         if response_data.get('status') == 'success':
             try:
@@ -297,18 +607,7 @@ def payment_callback(request):
                 return Response({'message': 'Transaction not found.'}, status=status.HTTP_404_NOT_FOUND)
 
             data = response_data.get('data', {})
-            if (data.get('status') == 'successful' and
-                float(data.get('amount', 0)) == float(transaction.amount) and
-                data.get('currency') == transaction.currency):
-
-                transaction.status = 'completed'
-                transaction.save()
-
-                cart = transaction.cart
-                cart.paid = True
-                cart.user = user
-                cart.save()
-
+            if transaction.apply_verification(data, user=user):
                 return Response({'message': 'Payment successful!', 'subMessage': 'You have successfully paid!'})
 
             else:
@@ -319,3 +618,113 @@ def payment_callback(request):
 
     else:
         return Response({'message': 'Payment was not successful'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+# Async variants of the payment views for the ASGI stack. They are plain Django
+# views (DRF's @api_view is sync only), so they authenticate the JWT themselves
+# and keep the worker free while the gateway call is in flight.
+
+async def _authenticate(request):
+    """Resolve the user from the request's credentials, or None."""
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = await sync_to_async(authentication_class().authenticate)(request)
+        except AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+@csrf_exempt
+@require_POST
+async def initiate_payment_async(request):
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return await start_payment_async(user)
+    if len(key) > 255:
+        return JsonResponse({'error': 'Idempotency-Key must be at most 255 characters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    record, replay = await sync_to_async(idempotency.begin)(user, 'initiate_payment', key)
+    if replay is not None:
+        replay_status, replay_body = replay
+        return JsonResponse(replay_body, status=replay_status, safe=False, headers={'Idempotent-Replayed': 'true'})
+
+    try:
+        response = await start_payment_async(user)
+    except Exception:
+        await sync_to_async(idempotency.release)(record)
+        raise
+
+    if response.status_code >= 500:
+        await sync_to_async(idempotency.release)(record)
+    else:
+        await sync_to_async(idempotency.complete)(record, response.status_code, json.loads(response.content))
+    return response
+
+
+async def start_payment_async(user):
+    cart, created = await Cart.objects.aget_or_create(user=user, paid=False, defaults={'cart_code': str(uuid4())})
+
+    tax = Decimal('4.00')
+    currency = "USD"
+    try:
+        transaction = await sync_to_async(Transaction.objects.create_for_cart)(cart, user, tax=tax, currency=currency)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    tx_ref, total_amount = transaction.ref, transaction.amount
+
+    phone = await Profile.objects.filter(user=user).values_list('phone', flat=True).afirst()
+    flutterwave_payload = build_payment_payload(tx_ref, total_amount, currency, user.email, phone)
+
+    try:
+        async with payments.create_async_client() as client:
+            response = await client.initiate_payment(flutterwave_payload)
+        return JsonResponse(response.json(), status=response.status_code)
+    except (httpx.HTTPError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+async def payment_callback_async(request):
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    status_param = request.GET.get('status')
+    tx_ref = request.GET.get('tx_ref')
+    transaction_id = request.GET.get('transaction_id')
+
+    if status_param != 'successful':
+        return JsonResponse({'message': 'Payment was not successful'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        async with payments.create_async_client() as client:
+            response = await client.verify_transaction(transaction_id)
+        response_data = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if response_data.get('status') != 'success':
+        return JsonResponse({'message': 'Failed to verify transaction with Flutterwave', 'subMessage': 'We could not verify your transaction!'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        transaction = await Transaction.objects.select_related('cart').aget(ref=tx_ref)
+    except Transaction.DoesNotExist:
+        return JsonResponse({'message': 'Transaction not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    completed = await sync_to_async(transaction.apply_verification)(response_data.get('data', {}), user=user)
+    if not completed:
+        return JsonResponse({'message': 'Payment verification failed', 'subMessage': 'Your payment verification failed!'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return JsonResponse({'message': 'Payment successful!', 'subMessage': 'You have successfully paid!'})
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def user_cache():
+    return caches[settings.USER_AUTH_CACHE_ALIAS]
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the token's user in USER_AUTH_CACHE_ALIAS for
+    USER_AUTH_CACHE_TIMEOUT seconds instead of loading it from the database on
+    every request. The entry is dropped whenever the user is saved or deleted
+    (see users/signals.py). That only reaches every worker when the cache is
+    shared, so the default 'shared' alias is a DummyCache unless REDIS_URL is
+    set, and the user is then read from the database on each request.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(user_id)
+        user = user_cache().get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache().set(key, user, settings.USER_AUTH_CACHE_TIMEOUT)
+            return user
+
+        # Same checks JWTAuthentication runs after its database lookup
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,144 @@
+"""
+In-process bloom filter of blacklisted refresh-token JTIs.
+
+Checking a refresh token against token_blacklist normally costs a join of
+BlacklistedToken and OutstandingToken on every refresh. The filter answers
+"definitely not blacklisted" from memory, so the database is only consulted on
+a positive (a real hit or a rare false positive).
+
+The filter is topped up with BlacklistedToken rows newer than the last id it
+has seen, plus rows blacklisted within TOKEN_BLACKLIST_REFRESH_MARGIN seconds
+before the previous top-up: auto-increment ids can commit out of order, so a
+row with a lower id may only become visible after a higher one was read. That happens whenever the cache version bumped by users/signals.py
+changes, or after TOKEN_BLACKLIST_REFRESH_INTERVAL seconds, since a local
+memory cache is not shared between processes. Bloom filters cannot drop
+entries, so the whole filter is rebuilt from unexpired tokens every
+TOKEN_BLACKLIST_REBUILD_INTERVAL seconds or once it outgrows its capacity.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+VERSION_KEY = 'auth:blacklist:version'
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings using blake2b double hashing."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        added = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            added = added or not self.bits[pos >> 3] & mask
+            self.bits[pos >> 3] |= mask
+        # Re-adding an item (e.g. in a refresh window) does not use up capacity
+        if added:
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+class TokenBlacklistFilter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._last_id = 0
+        self._version = None
+        self._refreshed_at = 0.0
+        self._built_at = 0.0
+        self._synced_at = None
+
+    def rebuild(self):
+        synced_at = aware_utcnow()
+        tokens = BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+        version = cache.get(VERSION_KEY)
+        last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        bloom = BloomFilter(
+            max(tokens.count() * 2, settings.TOKEN_BLACKLIST_BLOOM_CAPACITY),
+            settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE,
+        )
+        for jti in tokens.filter(id__lte=last_id).values_list('token__jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+
+        self._bloom, self._last_id, self._version, self._synced_at = bloom, last_id, version, synced_at
+        self._refreshed_at = self._built_at = time.monotonic()
+
+    def refresh(self):
+        version = cache.get(VERSION_KEY)
+        synced_at = aware_utcnow()
+        since = self._synced_at - timedelta(seconds=settings.TOKEN_BLACKLIST_REFRESH_MARGIN)
+        rows = (
+            BlacklistedToken.objects.filter(Q(id__gt=self._last_id) | Q(blacklisted_at__gte=since))
+            .order_by('id').values_list('id', 'token__jti')
+        )
+        for token_id, jti in rows.iterator(chunk_size=5000):
+            self._bloom.add(jti)
+            self._last_id = max(self._last_id, token_id)
+        self._version, self._synced_at = version, synced_at
+        self._refreshed_at = time.monotonic()
+
+    def _sync(self):
+        now = time.monotonic()
+        if (
+            self._bloom is None
+            or self._bloom.full
+            or now - self._built_at > settings.TOKEN_BLACKLIST_REBUILD_INTERVAL
+        ):
+            self.rebuild()
+        elif (
+            cache.get(VERSION_KEY) != self._version
+            or now - self._refreshed_at > settings.TOKEN_BLACKLIST_REFRESH_INTERVAL
+        ):
+            self.refresh()
+
+    def might_contain(self, jti):
+        with self._lock:
+            self._sync()
+            return jti in self._bloom
+
+    def add(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+
+_filter = TokenBlacklistFilter()
+
+
+def might_be_blacklisted(jti):
+    """False means the JTI is not blacklisted; True needs a database check."""
+    return _filter.might_contain(jti)
+
+
+def add(jti):
+    _filter.add(jti)
+
+
+def bump_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
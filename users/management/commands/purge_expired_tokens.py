@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding tokens and their blacklist entries, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Tokens deleted per batch (default 1000).")
+
+    def handle(self, *args, **options):
+        expired = OutstandingToken.objects.filter(expires_at__lte=aware_utcnow())
+
+        total = blacklisted = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # Blacklist rows first, so the outstanding token delete has nothing to cascade to
+            blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            total += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {total} expired outstanding token(s) and {blacklisted} blacklisted token(s)."
+        ))
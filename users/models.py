@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
-from PIL import Image
+import os
+
+from store import images
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -70,12 +72,26 @@ class Profile(models.Model):
     def __str__(self):
         return f"Profile of {self.first_name} {self.last_name} ({self.user.email})"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The raw value: reading self.image would load the column when it is deferred
+        image = self.__dict__.get('image')
+        self._saved_image_name = getattr(image, 'name', image)
+
+    def image_changed(self, update_fields=None):
+        if update_fields is not None and 'image' not in update_fields:
+            return False
+        if 'image' in self.get_deferred_fields() or not self.image:
+            return False
+        return self.image.name != self._saved_image_name or not self.image._committed
+
     def save(self, *args, **kwargs):
+        # Only resize when a new file was assigned, not on every profile save
+        process_image = self.image_changed(kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        if process_image:
+            self._saved_image_name = self.image.name
 
-        if self.image and self.image.path:
-            img = Image.open(self.image.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
+        if process_image and os.path.exists(self.image.path):
+            # Resized to 300x300 in the image worker pool, see store/images.py
+            images.generate_profile_thumbnail(self, (300, 300))
@@ -0,0 +1,14 @@
+"""
+drf-spectacular extensions for the project's simplejwt subclasses. The stock
+extensions only match the exact simplejwt classes, so without these the
+endpoints lose their jwtAuth security entries and the refresh schema.
+"""
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme, TokenRefreshSerializerExtension
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    target_class = 'users.authentication.CachedJWTAuthentication'
+
+
+class BlacklistFilterTokenRefreshSerializerExtension(TokenRefreshSerializerExtension):
+    target_class = 'users.serializers.BlacklistFilterTokenRefreshSerializer'
@@ -1,9 +1,11 @@
 from .models import User, Profile
-from store.serializers import NewCartItemSerializer, CartSerializer
-from store.models import CartItem
+from store.serializers import OrderItemSerializer
+from store.models import Cart, CheckoutInProgress, TransactionItem
+from store.cache import invalidate
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .tokens import RefreshToken
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -35,8 +37,13 @@ class UserSerializer(serializers.ModelSerializer):
         return user
     
     def get_items(self, user):
-        cartitems = CartItem.objects.filter(cart__user=user, cart__paid=True)[:10]
-        serializer = NewCartItemSerializer(cartitems, many=True)
+        # What was charged, not the live cart rows, which can change after payment
+        items = (
+            TransactionItem.objects.filter(transaction__cart__user=user, transaction__status='completed')
+            .select_related('product', 'transaction__cart')
+            .order_by('-transaction__modified_at', 'id')[:10]
+        )
+        serializer = OrderItemSerializer(items, many=True)
         return serializer.data
     
 class ProfileSerializer(serializers.ModelSerializer):
@@ -47,3 +54,26 @@ class ProfileSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'first_name', 'last_name', 'country', 'city', 'address', 'phone', 'bio', 'image']
         read_only_fields = ['user']
 
+
+
+class CartMergeTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair login that also folds the caller's guest cart into their own."""
+    cart_code = serializers.CharField(max_length=36, required=False, write_only=True)
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        cart_code = attrs.get('cart_code')
+        if cart_code:
+            try:
+                merged = Cart.objects.merge_guest_cart(self.user, cart_code)
+            except CheckoutInProgress:
+                # Logging in still works; the guest cart stays as it is until it can be merged
+                merged = None
+            if merged:
+                invalidate(self.user.id, cart_code)
+        return data
+
+
+class BlacklistFilterTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that checks the blacklist through the in-memory filter."""
+    token_class = RefreshToken
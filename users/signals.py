@@ -1,5 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from . import blacklist
+from .authentication import user_cache, user_cache_key
 from .models import User, Profile
 
 @receiver(post_save, sender=User)
@@ -8,8 +11,19 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    try:
-        instance.profile.save()
-    except Profile.DoesNotExist:
+def save_profile(sender, instance, created, update_fields=None, **kwargs):
+    # The profile is saved on its own; a user save only has to make sure one exists.
+    # New users get one from create_profile and partial saves (last_login etc.) never need one.
+    if created or update_fields:
+        return
+    if not Profile.objects.filter(user=instance).exists():
         Profile.objects.create(user=instance)
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache().delete(user_cache_key(instance.pk))
+
+@receiver(post_save, sender=BlacklistedToken)
+def bump_blacklist_version(sender, instance, created, **kwargs):
+    if created:
+        blacklist.bump_version()
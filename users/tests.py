@@ -1,3 +1,66 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from store.models import Cart, CartItem, Product, Transaction
+from .blacklist import TokenBlacklistFilter
+from .models import User
+
+
+@override_settings(USER_AUTH_CACHE_ALIAS='default')
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', password='x')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_deactivation_applies_on_next_request(self):
+        self.assertEqual(self.client.get('/api/get_useremail', **self.auth).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/get_useremail', **self.auth).status_code, 401)
+
+    def test_schema_declares_jwt_security(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        self.assertIn('jwtAuth', schema['components']['securitySchemes'])
+        secured = [
+            operation for path in schema['paths'].values() for operation in path.values()
+            if {'jwtAuth': []} in operation.get('security', [])
+        ]
+        self.assertTrue(secured)
+
+
+class OrderHistoryTests(TestCase):
+    def test_history_shows_what_was_charged(self):
+        user = User.objects.create_user(email='buyer@example.com', password='x')
+        product = Product.objects.create(name='Lamp', price=Decimal('20.00'), image='x.jpg')
+        cart = Cart.objects.create(cart_code='c1', user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+        payment = Transaction.objects.create_for_cart(cart, user, tax=Decimal('0.00'), currency='USD')
+        payment.apply_verification({'status': 'successful', 'amount': '40.00', 'currency': 'USD'})
+
+        # Later edits to the product or the paid cart's rows do not rewrite the order
+        Product.objects.filter(pk=product.pk).update(price=Decimal('99.00'))
+        CartItem.objects.filter(cart=cart).update(quantity=7)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        [item] = client.get('/api/user_info').json()['items']
+        self.assertEqual((item['unit_price'], item['quantity'], item['order_id']), ('20.00', 2, 'c1'))
+
+
+class TokenBlacklistFilterTests(TestCase):
+    def test_refresh_picks_up_rows_committed_out_of_id_order(self):
+        user = User.objects.create_user(email='buyer@example.com', password='x')
+        bloom = TokenBlacklistFilter()
+        bloom.rebuild()
+
+        token = RefreshToken.for_user(user)
+        token.blacklist()
+        # As if a row with a higher id had committed first and been read already
+        bloom._last_id = BlacklistedToken.objects.get().id + 1
+        bloom.refresh()
+        self.assertTrue(bloom.might_contain(token['jti']))
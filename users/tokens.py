@@ -0,0 +1,22 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from . import blacklist
+
+
+class RefreshToken(tokens.RefreshToken):
+    """RefreshToken whose blacklist check is screened by users.blacklist first."""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        if blacklist.might_be_blacklisted(jti) and BlacklistedToken.objects.filter(token__jti=jti).exists():
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist.add(self.payload[api_settings.JTI_CLAIM])
+        return result